@@ -1,19 +1,50 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Query
+from fastapi import FastAPI, HTTPException, Depends, status, Query, UploadFile, File, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, EmailStr
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument, UpdateOne, ASCENDING, DESCENDING, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from bson import ObjectId
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 from datetime import datetime, timedelta
 import os
 import jwt
-import hashlib
+import base64
+import json
 import uuid
 from typing import Optional, List
+from collections import OrderedDict, defaultdict, deque
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
 import secrets
+import hashlib
+import asyncio
+import time
 import calendar
+import csv
+import io
+import codecs
+import re
+import math
+import threading
+import contextvars
+import random
+import sys
+from contextlib import asynccontextmanager
+
+# The Mongo client is opened and warmed up here rather than at import; see start_database()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_database()
+    yield
+    await stop_database()
 
-app = FastAPI(title="Demo Banking API", version="1.0.0")
+# orjson renders responses; list routes return ORJSONResponse directly so FastAPI skips jsonable_encoder
+app = FastAPI(title="Demo Banking API", version="1.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -24,16 +55,690 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# The ASGI scope of the request being served, read by the command listeners
+request_scope = contextvars.ContextVar("request_scope", default=None)
+
+# Metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+REQUEST_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is O(log buckets)"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> List[str]:
+        separator = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+        return lines
+
+def metric_labels(**labels) -> str:
+    return ",".join(
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for key, value in labels.items()
+    )
+
+class Metrics:
+    """Request, Mongo command and pool checkout metrics, updated from Motor's worker threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.request_latency = {}
+        self.in_flight = 0
+        self.mongo_latency = {}
+        self.mongo_failures = defaultdict(int)
+        self.pool_wait = Histogram(MONGO_LATENCY_BUCKETS)
+        self.pool_checkout_failures = defaultdict(int)
+        self.pool_open = defaultdict(int)  # server address -> open connections
+        self.pool_in_use = defaultdict(int)  # server address -> checked out connections
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float):
+        with self.lock:
+            self.requests[(method, route, status_code)] += 1
+            histogram = self.request_latency.get((method, route))
+            if histogram is None:
+                histogram = self.request_latency[(method, route)] = Histogram(REQUEST_LATENCY_BUCKETS)
+            histogram.observe(seconds)
+
+    def observe_command(self, collection: str, command: str, seconds: float, failed: bool):
+        with self.lock:
+            histogram = self.mongo_latency.get((collection, command))
+            if histogram is None:
+                histogram = self.mongo_latency[(collection, command)] = Histogram(MONGO_LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            if failed:
+                self.mongo_failures[(collection, command)] += 1
+
+    def observe_checkout(self, seconds: Optional[float], failure_reason: Optional[str] = None):
+        with self.lock:
+            if failure_reason:
+                self.pool_checkout_failures[failure_reason] += 1
+            else:
+                self.pool_wait.observe(seconds)
+
+    def adjust_pool(self, address: str, open_delta: int = 0, in_use_delta: int = 0):
+        with self.lock:
+            self.pool_open[address] += open_delta
+            self.pool_in_use[address] += in_use_delta
+
+    def pool_stats(self) -> dict:
+        with self.lock:
+            return {
+                address: {"open": self.pool_open[address], "in_use": self.pool_in_use[address]}
+                for address in self.pool_open
+            }
+
+    def render(self) -> str:
+        worker = os.getpid()
+        
+        def worker_labels(**labels) -> str:
+            return metric_labels(worker=worker, **labels)
+        
+        with self.lock:
+            lines = [
+                "# HELP http_requests_total HTTP requests by method, route template and status code",
+                "# TYPE http_requests_total counter"
+            ]
+            for (method, route, status_code), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{{{worker_labels(method=method, route=route, status=status_code)}}} {count}")
+            lines += [
+                "# HELP http_request_duration_seconds HTTP request latency by method and route template",
+                "# TYPE http_request_duration_seconds histogram"
+            ]
+            for (method, route), histogram in sorted(self.request_latency.items()):
+                lines += histogram.render("http_request_duration_seconds", worker_labels(method=method, route=route))
+            lines += [
+                "# HELP http_requests_in_flight HTTP requests currently being served",
+                "# TYPE http_requests_in_flight gauge",
+                f"http_requests_in_flight{{{worker_labels()}}} {self.in_flight}",
+                "# HELP mongodb_command_duration_seconds MongoDB command latency by collection and command",
+                "# TYPE mongodb_command_duration_seconds histogram"
+            ]
+            for (collection, command), histogram in sorted(self.mongo_latency.items()):
+                lines += histogram.render(
+                    "mongodb_command_duration_seconds", worker_labels(collection=collection, command=command)
+                )
+            lines += [
+                "# HELP mongodb_command_failures_total Failed MongoDB commands by collection and command",
+                "# TYPE mongodb_command_failures_total counter"
+            ]
+            for (collection, command), count in sorted(self.mongo_failures.items()):
+                lines.append(f"mongodb_command_failures_total{{{worker_labels(collection=collection, command=command)}}} {count}")
+            lines += [
+                "# HELP mongodb_pool_checkout_wait_seconds Time spent waiting to check a connection out of the pool",
+                "# TYPE mongodb_pool_checkout_wait_seconds histogram"
+            ]
+            lines += self.pool_wait.render("mongodb_pool_checkout_wait_seconds", worker_labels())
+            lines += [
+                "# HELP mongodb_pool_checkout_failures_total Failed connection checkouts by reason",
+                "# TYPE mongodb_pool_checkout_failures_total counter"
+            ]
+            for reason, count in sorted(self.pool_checkout_failures.items()):
+                lines.append(f"mongodb_pool_checkout_failures_total{{{worker_labels(reason=reason)}}} {count}")
+            lines += [
+                "# HELP mongodb_pool_connections Open pool connections by server",
+                "# TYPE mongodb_pool_connections gauge"
+            ]
+            for address, count in sorted(self.pool_open.items()):
+                lines.append(f"mongodb_pool_connections{{{worker_labels(address=address)}}} {count}")
+            lines += [
+                "# HELP mongodb_pool_connections_in_use Checked out pool connections by server",
+                "# TYPE mongodb_pool_connections_in_use gauge"
+            ]
+            for address, count in sorted(self.pool_in_use.items()):
+                lines.append(f"mongodb_pool_connections_in_use{{{worker_labels(address=address)}}} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# Comment set on change streams so their waiting getMores stay out of metrics and the slow query log
+AWAIT_DATA_COMMENT = "await-data"
+
+def awaits_data(event) -> bool:
+    return event.command_name == "getMore" and event.command.get("comment") == AWAIT_DATA_COMMENT
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Times every MongoDB command by the collection it targets"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def started(self, event):
+        if awaits_data(event):
+            return
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        self.collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        metrics.observe_command(collection, event.command_name, event.duration_micros / 1e6, False)
+        profile = active_profile.get()
+        if profile:
+            profile.add_mongo(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        metrics.observe_command(collection, event.command_name, event.duration_micros / 1e6, True)
+        profile = active_profile.get()
+        if profile:
+            profile.add_mongo(event.duration_micros / 1e6)
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Measures connection checkout waits and tracks open/in-use connections per server"""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        metrics.observe_checkout(time.perf_counter() - getattr(self.local, "started", time.perf_counter()))
+        metrics.adjust_pool("%s:%s" % event.address, in_use_delta=1)
+
+    def connection_checked_in(self, event):
+        metrics.adjust_pool("%s:%s" % event.address, in_use_delta=-1)
+
+    def connection_created(self, event):
+        metrics.adjust_pool("%s:%s" % event.address, open_delta=1)
+
+    def connection_closed(self, event):
+        metrics.adjust_pool("%s:%s" % event.address, open_delta=-1)
+
+    def connection_check_out_failed(self, event):
+        metrics.observe_checkout(None, str(event.reason))
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency, status codes and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        request_scope.set(scope)
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = scope.get("route")
+            metrics.observe_request(
+                scope["method"], route.path if route else "unmatched", status_code, time.perf_counter() - started
+            )
+
+app.add_middleware(MetricsMiddleware)
+
+# Slow query log
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))  # negative disables the log
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '500'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+SLOW_QUERY_PLAN_CACHE_SIZE = 1000
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# Session and transport fields that explain() rejects or that are not part of the query
+NON_QUERY_FIELDS = {
+    "lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern",
+    "$db", "$clusterTime", "$readPreference", "cursor", "maxTimeMS", "comment"
+}
+
+def query_shape(value):
+    """Replace every literal in a filter with "?" while keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+def command_shape(command_name: str, command: dict) -> dict:
+    """The redacted filter, sort and pipeline of a command; documents being written are never included"""
+    if command_name == "find":
+        shape = {"filter": query_shape(command.get("filter", {}))}
+        if command.get("sort"):
+            shape["sort"] = dict(command["sort"])
+        return shape
+    if command_name == "aggregate":
+        return {"pipeline": query_shape(command.get("pipeline", []))}
+    if command_name in ("count", "distinct", "findAndModify"):
+        shape = {"filter": query_shape(command.get("query", {}))}
+        if command.get("sort"):
+            shape["sort"] = dict(command["sort"])
+        return shape
+    if command_name == "update":
+        return {"filter": query_shape([statement.get("q", {}) for statement in command.get("updates", [])])}
+    if command_name == "delete":
+        return {"filter": query_shape([statement.get("q", {}) for statement in command.get("deletes", [])])}
+    return {}
+
+class SlowQueryLog:
+    """Bounded log of slow commands plus the explain() summary of each shape seen"""
+
+    def __init__(self, threshold_ms: float, size: int):
+        self.threshold_ms = threshold_ms
+        self.entries = deque(maxlen=size)
+        self.plans = OrderedDict()
+        self.lock = threading.Lock()
+        self.loop = None  # set on startup; explain() runs there, not in pymongo's thread
+
+    def record(self, database: str, collection: str, command_name: str, command: dict, duration_ms: float, failed: bool):
+        scope = request_scope.get()
+        route = scope.get("route") if scope else None
+        shape = command_shape(command_name, command)
+        shape_key = json.dumps([collection, command_name, shape], sort_keys=True, default=str)
+        with self.lock:
+            first_sighting = shape_key not in self.plans
+            if first_sighting:
+                self.plans[shape_key] = None
+                while len(self.plans) > SLOW_QUERY_PLAN_CACHE_SIZE:
+                    self.plans.popitem(last=False)
+            self.entries.append({
+                "at": datetime.utcnow(),
+                "route": f"{scope['method']} {route.path if route else 'unmatched'}" if scope else "background",
+                "database": database,
+                "collection": collection,
+                "command": command_name,
+                "duration_ms": round(duration_ms, 3),
+                "failed": failed,
+                "shape": shape,
+                "shape_key": shape_key
+            })
+        if first_sighting and SLOW_QUERY_EXPLAIN and command_name in EXPLAINABLE_COMMANDS and self.loop:
+            explained = {key: value for key, value in command.items() if key not in NON_QUERY_FIELDS}
+            asyncio.run_coroutine_threadsafe(self.explain(database, shape_key, explained), self.loop)
+
+    async def explain(self, database: str, shape_key: str, command: dict):
+        try:
+            explain = await client[database].command({"explain": command, "verbosity": "queryPlanner"})
+            plan = explain["queryPlanner"]["winningPlan"]
+            summary = {"stages": plan_stages(plan), "indexes": plan_indexes(plan)}
+            summary["collscan"] = "COLLSCAN" in summary["stages"]
+        except Exception as e:
+            summary = {"error": str(e)}
+        with self.lock:
+            if shape_key in self.plans:
+                self.plans[shape_key] = summary
+
+    def snapshot(self, limit: int) -> List[dict]:
+        with self.lock:
+            entries = list(self.entries)[-limit:] if limit else []
+            return [
+                {**{key: value for key, value in entry.items() if key != "shape_key"},
+                 "plan": self.plans.get(entry["shape_key"])}
+                for entry in reversed(entries)
+            ]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.plans.clear()
+
+slow_queries = SlowQueryLog(SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_SIZE)
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Feeds commands slower than SLOW_QUERY_THRESHOLD_MS into the slow query log"""
+
+    def __init__(self):
+        self.commands = {}
+
+    def started(self, event):
+        if event.command_name != "explain" and not awaits_data(event):
+            self.commands[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self.finished(event, False)
+
+    def failed(self, event):
+        self.finished(event, True)
+
+    def finished(self, event, failed: bool):
+        started = self.commands.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if started is None or duration_ms < slow_queries.threshold_ms:
+            return
+        database, command = started
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        slow_queries.record(
+            database, collection if isinstance(collection, str) else "", event.command_name, command, duration_ms, failed
+        )
+
+# Request profiler
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '1'))
+PROFILE_STORE_SIZE = int(os.environ.get('PROFILE_STORE_SIZE', '100'))
+
+# The request profile the current task is recording, if any
+active_profile = contextvars.ContextVar("active_profile", default=None)
+
+def frame_category(filename: str, function: str) -> Optional[str]:
+    """Which part of the request a stack frame belongs to, if it is not plain handler code"""
+    if "/pydantic/" in filename or "/pydantic_core/" in filename or filename.endswith("fastapi/_compat.py"):
+        return "pydantic"
+    if filename.endswith("fastapi/encoders.py") or "/json/" in filename or (
+        filename.endswith("responses.py") and function == "render"
+    ):
+        return "json"
+    return None
+
+class RequestProfile:
+    """Collapsed stacks and timings of one profiled request"""
+
+    def __init__(self, scope: dict, task):
+        self.profile_id = str(uuid.uuid4())
+        self.scope = scope
+        self.task = task
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stacks = defaultdict(int)  # collapsed stack -> microseconds
+        self.categories = defaultdict(float)
+        self.samples = 0
+        self.sampled_seconds = 0.0
+        self.mongo_seconds = 0.0
+        self.mongo_commands = 0
+        self.result = None
+
+    def add_mongo(self, seconds: float):
+        with self.lock:
+            self.mongo_seconds += seconds
+            self.mongo_commands += 1
+
+    def add_sample(self, frame, seconds: float):
+        stack = []
+        category = None
+        while frame is not None:
+            code = frame.f_code
+            # Everything below the task's first frame is event loop machinery
+            if code.co_name == "_run" and code.co_filename.endswith("asyncio/events.py"):
+                break
+            category = category or frame_category(code.co_filename, code.co_name)
+            stack.append(f"{code.co_name} ({'/'.join(code.co_filename.rsplit('/', 2)[-2:])}:{code.co_firstlineno})")
+            frame = frame.f_back
+        with self.lock:
+            self.stacks[";".join(reversed(stack))] += round(seconds * 1e6)
+            self.categories[category or "handler"] += seconds
+            self.samples += 1
+            self.sampled_seconds += seconds
+
+    def finish(self, status_code: int):
+        wall = time.perf_counter() - self.started
+        route = self.scope.get("route")
+        with self.lock:
+            cpu = self.sampled_seconds
+            self.result = {
+                "profile_id": self.profile_id,
+                "worker": os.getpid(),
+                "started_at": self.started_at,
+                "method": self.scope["method"],
+                "path": self.scope["path"],
+                "route": route.path if route else "unmatched",
+                "status": status_code,
+                "wall_ms": round(wall * 1000, 3),
+                "cpu_ms": round(cpu * 1000, 3),
+                "breakdown_ms": {
+                    "mongo": round(self.mongo_seconds * 1000, 3),
+                    "pydantic": round(self.categories["pydantic"] * 1000, 3),
+                    "json": round(self.categories["json"] * 1000, 3),
+                    "handler": round(self.categories["handler"] * 1000, 3),
+                    "other_wait": round(max(wall - cpu - self.mongo_seconds, 0) * 1000, 3)
+                },
+                "mongo_commands": self.mongo_commands,
+                "samples": self.samples,
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "stacks": dict(self.stacks)
+            }
+
+class Profiler:
+    """Runs the sampler thread while any request is being profiled and keeps the last profiles"""
+
+    def __init__(self, store_size: int):
+        self.active = {}
+        self.profiles = deque(maxlen=store_size)
+        self.lock = threading.Lock()
+        self.sampler = None
+
+    def start(self, scope: dict) -> RequestProfile:
+        profile = RequestProfile(scope, asyncio.current_task())
+        with self.lock:
+            self.active[profile.task] = (profile, asyncio.get_running_loop(), threading.get_ident())
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self.sample, name="request-profiler", daemon=True)
+                self.sampler.start()
+        return profile
+
+    def stop(self, profile: RequestProfile, status_code: int):
+        with self.lock:
+            self.active.pop(profile.task, None)
+        profile.finish(status_code)
+        self.profiles.append(profile.result)
+
+    def sample(self):
+        last = time.perf_counter()
+        while True:
+            time.sleep(PROFILE_INTERVAL_MS / 1000)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            with self.lock:
+                if not self.active:
+                    self.sampler = None
+                    return
+                active = list(self.active.values())
+            frames = sys._current_frames()
+            for profile, loop, thread_id in active:
+                # Only count samples taken while the profiled request's own task holds the loop
+                if asyncio.current_task(loop) is profile.task and thread_id in frames:
+                    profile.add_sample(frames[thread_id], elapsed)
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return next((result for result in self.profiles if result["profile_id"] == profile_id), None)
+
+profiler = Profiler(PROFILE_STORE_SIZE)
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware profiling sampled or explicitly requested requests; others pay one random() call"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        profile = profiler.start(scope)
+        token = active_profile.set(profile)
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.profile_id.encode()),
+                    (b"x-profile-worker", str(os.getpid()).encode())
+                ]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            active_profile.reset(token)
+            profiler.stop(profile, status_code)
+
+    def should_profile(self, scope: dict) -> bool:
+        if PROFILE_TOKEN:
+            for name, value in scope["headers"]:
+                if name == b"x-profile-token":
+                    return secrets.compare_digest(value, PROFILE_TOKEN.encode())
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+app.add_middleware(ProfilerMiddleware)
+
 # MongoDB connection
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = MongoClient(MONGO_URL)
-db = client.demo_banking
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_MAX_CONNECTING = int(os.environ.get('MONGO_MAX_CONNECTING', '4'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = os.environ.get('MONGO_SOCKET_TIMEOUT_MS')  # unset: no socket timeout
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS')  # unset: wait for a free connection
+MONGO_MAX_IDLE_TIME_MS = os.environ.get('MONGO_MAX_IDLE_TIME_MS')  # unset: keep idle connections
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')  # e.g. "zstd,zlib"; zstd/snappy need their client libraries
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get('MONGO_WARMUP_CONNECTIONS', str(MONGO_MIN_POOL_SIZE)))
+MONGO_WARMUP_RETRY_SECONDS = float(os.environ.get('MONGO_WARMUP_RETRY_SECONDS', '5'))
+HEALTH_PING_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_PING_TIMEOUT_SECONDS', '2'))
+# Read preference for reporting_db; max staleness must be at least 90 seconds, -1 means no limit
+REPORTING_READ_PREFERENCE = os.environ.get('REPORTING_READ_PREFERENCE', 'secondaryPreferred')
+REPORTING_MAX_STALENESS_SECONDS = int(os.environ.get('REPORTING_MAX_STALENESS_SECONDS', '90'))
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+
+def reporting_read_preference():
+    if REPORTING_READ_PREFERENCE not in READ_PREFERENCES:
+        raise ValueError(f"REPORTING_READ_PREFERENCE must be one of {', '.join(READ_PREFERENCES)}")
+    if REPORTING_READ_PREFERENCE == "primary":
+        return Primary()
+    return READ_PREFERENCES[REPORTING_READ_PREFERENCE](max_staleness=REPORTING_MAX_STALENESS_SECONDS)
+
+# Opened by connect_database() from the app lifespan or a CLI command
+client = None
+db = None
+reporting_db = None
+
+def connect_database():
+    """Create the Motor client with the configured pool, reusing one that is already open"""
+    global client, db, reporting_db
+    if client is None:
+        client = create_client()
+    db = client.demo_banking
+    reporting_db = client.get_database("demo_banking", read_preference=reporting_read_preference())
+
+def create_client() -> AsyncIOMotorClient:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxConnecting": MONGO_MAX_CONNECTING,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = int(MONGO_SOCKET_TIMEOUT_MS)
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = int(MONGO_WAIT_QUEUE_TIMEOUT_MS)
+    if MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = int(MONGO_MAX_IDLE_TIME_MS)
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    listeners = [CommandMetricsListener(), PoolMetricsListener()]
+    if SLOW_QUERY_THRESHOLD_MS >= 0:
+        listeners.append(SlowQueryListener())
+    return AsyncIOMotorClient(MONGO_URL, event_listeners=listeners, **options)
+
+def close_database():
+    global client, db, reporting_db
+    if client is not None:
+        client.close()
+    client = None
+    db = None
+    reporting_db = None
 
 # JWT settings
 JWT_SECRET = "demo_banking_secret_key_2025"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Month-end processing settings
+BULK_OPERATIONS_BATCH_SIZE = int(os.environ.get('BULK_OPERATIONS_BATCH_SIZE', '500'))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '60'))
+
+# Transfer settings
+TRANSFER_BATCH_MAX = int(os.environ.get('TRANSFER_BATCH_MAX', '1000'))
+
+# Credit/debit CSV import settings
+CREDIT_DEBIT_IMPORT_CHUNK_SIZE = int(os.environ.get('CREDIT_DEBIT_IMPORT_CHUNK_SIZE', '500'))
+CREDIT_DEBIT_IMPORT_MAX_ERRORS = int(os.environ.get('CREDIT_DEBIT_IMPORT_MAX_ERRORS', '1000'))
+CREDIT_DEBIT_MAX_AMOUNT = float(os.environ.get('CREDIT_DEBIT_MAX_AMOUNT', '1000000'))
+
+# Admin directory settings
+DIRECTORY_COUNT_LIMIT = int(os.environ.get('DIRECTORY_COUNT_LIMIT', '10000'))
+
+# Password hashing settings
+PASSWORD_HASH_SCHEME = os.environ.get('PASSWORD_HASH_SCHEME', 'pbkdf2_sha256')
+PASSWORD_HASH_ROUNDS = os.environ.get('PASSWORD_HASH_ROUNDS')  # unset: passlib's default cost for the scheme
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '1000'))
+
+# In-process cache settings
+PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', '10000'))
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', '60'))
+ACCOUNT_CACHE_SIZE = int(os.environ.get('ACCOUNT_CACHE_SIZE', '50000'))
+ACCOUNT_CACHE_TTL = float(os.environ.get('ACCOUNT_CACHE_TTL', '60'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+IDEMPOTENCY_CACHE_TTL = float(os.environ.get('IDEMPOTENCY_CACHE_TTL', '600'))
+CACHE_WARMUP_USERS = int(os.environ.get('CACHE_WARMUP_USERS', '1000'))
+
+# Server settings
+SERVER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', '1'))
+
+# Idempotency key settings
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '10'))
+# An in-progress key whose lease was not renewed for this long belongs to a dead worker and can be taken over
+IDEMPOTENCY_LEASE_SECONDS = float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '30'))
+
 security = HTTPBearer()
 
 # Pydantic models
@@ -61,6 +766,9 @@ class TransferRequest(BaseModel):
     recipient_bank: Optional[str] = None
     routing_number: Optional[str] = None
 
+class BatchTransferRequest(BaseModel):
+    transfers: List[TransferRequest]
+
 class AdminCreditDebit(BaseModel):
     account_id: str
     amount: float
@@ -86,12 +794,142 @@ class TransactionFilter(BaseModel):
     min_amount: Optional[float] = None
     max_amount: Optional[float] = None
 
+# Password hashing
+pwd_context = CryptContext(
+    schemes=[PASSWORD_HASH_SCHEME, "hex_sha256"],
+    deprecated=["hex_sha256"],
+    **({f"{PASSWORD_HASH_SCHEME}__rounds": int(PASSWORD_HASH_ROUNDS)} if PASSWORD_HASH_ROUNDS else {})
+)
+
+class PasswordHasher:
+    """Runs KDF calls on a bounded thread pool so they never block the event loop"""
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.semaphore = asyncio.Semaphore(workers)
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.hash_seconds_total = 0.0
+
+    async def run(self, fn, *args):
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please retry")
+
+        self.queued += 1
+        queued_at = time.perf_counter()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+        try:
+            started = time.perf_counter()
+            waited = started - queued_at
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            self.in_flight += 1
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.hash_seconds_total += time.perf_counter() - started
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "scheme": PASSWORD_HASH_SCHEME,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds_total / self.completed * 1000, 3) if self.completed else None,
+            "max_wait_ms": round(self.wait_seconds_max * 1000, 3),
+            "avg_hash_ms": round(self.hash_seconds_total / self.completed * 1000, 3) if self.completed else None
+        }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+# In-process caches
+class TTLCache:
+    """Bounded LRU cache whose entries also expire `ttl` seconds after being stored"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value):
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        for key in [key for key, (value, _) in self.entries.items() if predicate(value)]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+# user_id -> user document without the password hash
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+# account_id -> the account's owner, status and immutable identifiers
+account_cache = TTLCache(ACCOUNT_CACHE_SIZE, ACCOUNT_CACHE_TTL)
+ACCOUNT_CACHE_PROJECTION = {"_id": 0, "account_id": 1, "user_id": 1, "status": 1, "account_number": 1, "account_type": 1,
+                            "created_at": 1}
+# user/endpoint/Idempotency-Key -> the completed response stored for that key
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CACHE_TTL)
+
+def invalidate_user(user_id: str):
+    """Drop a user's cached principal and the cached ownership entries of their accounts"""
+    principal_cache.invalidate(user_id)
+    account_cache.invalidate_where(lambda account: account["user_id"] == user_id)
+
 # Utility functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+async def hash_password(password: str) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return hash_password(password) == hashed
+async def verify_password(password: str, hashed: str):
+    """Return (valid, replacement_hash); replacement_hash is set when the stored hash should be upgraded"""
+    return await password_hasher.run(pwd_context.verify_and_update, password, hashed)
 
 def create_jwt_token(user_data: dict) -> str:
     payload = {
@@ -114,19 +952,49 @@ def verify_jwt_token(token: str) -> dict:
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     payload = verify_jwt_token(token)
-    user = db.users.find_one({"user_id": payload["user_id"]})
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    user = principal_cache.get(payload["user_id"])
+    if user is None:
+        user = await db.users.find_one({"user_id": payload["user_id"]}, {"password": 0, "search_terms": 0})
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal_cache.set(payload["user_id"], user)
     return user
 
+async def get_account_summary(account_id: str) -> Optional[dict]:
+    """Owner, status, number and type of an account, served from account_cache when warm"""
+    account = account_cache.get(account_id)
+    if account is None:
+        account = await db.accounts.find_one({"account_id": account_id}, ACCOUNT_CACHE_PROJECTION)
+        if account:
+            account_cache.set(account_id, account)
+    return account
+
+async def authorize_account_access(account_id: str, current_user: dict) -> dict:
+    """Return the account summary if the user owns the account or is an admin"""
+    account = await get_account_summary(account_id)
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    if current_user["role"] not in ["admin", "super_admin"] and account["user_id"] != current_user["user_id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return account
+
 def generate_account_number() -> str:
     return str(secrets.randbelow(9000000000) + 1000000000)
 
-def create_user_accounts(user_id: str):
+def account_owner_fields(user: dict) -> dict:
+    """Owner name/email denormalized onto accounts so the admin accounts view needs no join"""
+    return {"user_name": f"{user['first_name']} {user['last_name']}", "user_email": user["email"]}
+
+async def sync_account_owner(user: dict):
+    """Re-copy a user's name/email onto their accounts; call after changing either on the user"""
+    await db.accounts.update_many({"user_id": user["user_id"]}, {"$set": account_owner_fields(user)})
+
+async def create_user_accounts(user: dict):
     accounts = [
         {
             "account_id": str(uuid.uuid4()),
-            "user_id": user_id,
+            "user_id": user["user_id"],
             "account_number": generate_account_number(),
             "account_type": "checking",
             "balance": 1000.00,  # Demo starting balance
@@ -134,12 +1002,13 @@ def create_user_accounts(user_id: str):
             "interest_rate": 0.01,  # 1% annual interest
             "monthly_fee": 5.00,
             "minimum_balance": 100.00,
+            **account_owner_fields(user),
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         },
         {
             "account_id": str(uuid.uuid4()),
-            "user_id": user_id,
+            "user_id": user["user_id"],
             "account_number": generate_account_number(),
             "account_type": "savings",
             "balance": 5000.00,  # Demo starting balance
@@ -147,72 +1016,645 @@ def create_user_accounts(user_id: str):
             "interest_rate": 0.025,  # 2.5% annual interest
             "monthly_fee": 0.00,
             "minimum_balance": 500.00,
+            **account_owner_fields(user),
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
     ]
     
-    result = db.accounts.insert_many(accounts)
+    result = await db.accounts.insert_many(accounts)
     
     # Add _id to each account
     for i, account_id in enumerate(result.inserted_ids):
         accounts[i]["_id"] = str(account_id)
+    
+    # Record the opening balances so statements have a starting point
+    await db.balance_snapshots.insert_many([
+        {
+            "account_id": account["account_id"],
+            "date": snapshot_day(account["created_at"]),
+            "closing_balance": account["balance"],
+            "version": 0,
+            "updated_at": datetime.utcnow()
+        }
+        for account in accounts
+    ])
+    await record_rollups({"accounts_total": len(accounts), "total_balance": sum(a["balance"] for a in accounts)})
         
     return accounts
 
-def create_transaction(transaction_data: dict):
-    transaction = {
+def new_transaction(transaction_data: dict) -> dict:
+    return {
         "transaction_id": str(uuid.uuid4()),
         **transaction_data,
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
-    result = db.transactions.insert_one(transaction)
-    transaction["_id"] = str(result.inserted_id)
-    return transaction
-
-def apply_monthly_interest(account_id: str):
-    """Apply monthly interest to savings accounts"""
-    account = db.accounts.find_one({"account_id": account_id})
-    if account and account["account_type"] == "savings":
-        monthly_interest = account["balance"] * (account["interest_rate"] / 12)
-        if monthly_interest > 0:
-            db.accounts.update_one(
-                {"account_id": account_id},
-                {"$inc": {"balance": monthly_interest}, "$set": {"updated_at": datetime.utcnow()}}
-            )
-            
-            # Create interest transaction
-            create_transaction({
-                "from_account_id": None,
-                "to_account_id": account_id,
-                "amount": monthly_interest,
-                "transfer_type": "interest_credit",
-                "description": "Monthly interest credit",
-                "status": "completed",
-                "user_id": account["user_id"]
-            })
 
-def apply_monthly_fees(account_id: str):
-    """Apply monthly fees to accounts"""
-    account = db.accounts.find_one({"account_id": account_id})
-    if account and account["monthly_fee"] > 0:
-        if account["balance"] >= account["monthly_fee"]:
-            db.accounts.update_one(
-                {"account_id": account_id},
-                {"$inc": {"balance": -account["monthly_fee"]}, "$set": {"updated_at": datetime.utcnow()}}
+def snapshot_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def record_balance_snapshots(snapshots: List[tuple]):
+    """Store (account_id, balance, balance_version) tuples as the closing balances of the current day"""
+    if not snapshots:
+        return
+    today = snapshot_day(datetime.utcnow())
+    operations = [
+        UpdateOne(
+            {"account_id": account_id, "date": today, "version": {"$lt": version}},
+            {"$set": {"closing_balance": balance, "version": version, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        for account_id, balance, version in snapshots
+    ]
+    try:
+        await db.balance_snapshots.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys mean a newer balance change already recorded today's snapshot
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+async def update_balance(account_id: str, amount: float, conditions: Optional[dict] = None, session=None):
+    """Apply a balance change if the account still matches `conditions`; returns the account or None"""
+    return await db.accounts.find_one_and_update(
+        {"account_id": account_id, **(conditions or {})},
+        {"$inc": {"balance": amount, "balance_version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+
+async def record_balance_changes(changes: List[tuple], transactions: Optional[List[dict]] = None):
+    """Record end-of-day snapshots and rollups for (updated_account, amount) pairs and new ledger entries"""
+    await record_balance_snapshots([
+        (account["account_id"], account["balance"], account.get("balance_version", 0)) for account, _ in changes
+    ])
+    await record_transaction_rollups(transactions or [], {"total_balance": sum(amount for _, amount in changes)})
+
+# Multi-document transactions
+_transactions_supported = None
+
+async def transactions_supported() -> bool:
+    """Transactions need a replica set or sharded cluster; a standalone mongod gets plain writes"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await client.admin.command("hello")
+        _transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+async def run_in_transaction(callback):
+    """Run `callback(session)` inside a multi-document transaction, or `callback(None)` where unsupported"""
+    if not await transactions_supported():
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
+
+# Cache invalidation bus
+CACHE_INVALIDATION_BUS = os.environ.get('CACHE_INVALIDATION_BUS', 'true').lower() == 'true'
+INVALIDATION_BUS_RETRY_SECONDS = float(os.environ.get('INVALIDATION_BUS_RETRY_SECONDS', '1'))
+# User fields that principal_cache serves
+USER_CACHED_FIELDS = ["status", "role", "email", "first_name", "last_name", "phone", "address", "date_of_birth"]
+
+class InvalidationBus:
+    """Dispatches "user", "account_status" and "balance" changes to subscribers"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(list)
+        self.resume_token = None
+        self.state = "stopped"
+        self.events = 0
+        self.restarts = 0
+        self.last_event_at = None
+
+    def subscribe(self, kind: str, callback):
+        self.subscribers[kind].append(callback)
+
+    def pipeline(self) -> list:
+        account_fields = ["status"] + (["balance"] if self.subscribers["balance"] else [])
+        updated = lambda fields: [{f"updateDescription.updatedFields.{field}": {"$exists": True}} for field in fields]
+        return [
+            {"$match": {"$or": [
+                {"ns.coll": {"$in": ["users", "accounts"]}, "operationType": {"$in": ["replace", "delete"]}},
+                {"ns.coll": "users", "operationType": "update", "$or": updated(USER_CACHED_FIELDS)},
+                {"ns.coll": "accounts", "operationType": "update", "$or": updated(account_fields)}
+            ]}},
+            {"$project": {
+                "ns.coll": 1,
+                "operationType": 1,
+                "fullDocument.user_id": 1,
+                "fullDocument.account_id": 1,
+                "updateDescription.updatedFields.status": 1,
+                "updateDescription.updatedFields.balance": 1
+            }}
+        ]
+
+    def publish(self, kind: str, key: Optional[str]):
+        for callback in self.subscribers[kind]:
+            callback(key)
+
+    def dispatch(self, change: dict):
+        document = change.get("fullDocument") or {}
+        updated = change.get("updateDescription", {}).get("updatedFields")
+        if change["ns"]["coll"] == "users":
+            self.publish("user", document.get("user_id"))
+        else:
+            account_id = document.get("account_id")
+            if updated is None or "status" in updated:
+                self.publish("account_status", account_id)
+            if updated is None or "balance" in updated:
+                self.publish("balance", account_id)
+        self.events += 1
+        self.last_event_at = datetime.utcnow()
+
+    async def run(self):
+        while True:
+            try:
+                # Change streams have the same deployment requirement as transactions
+                if not CACHE_INVALIDATION_BUS or not await transactions_supported():
+                    self.state = "disabled"
+                    print("Cache invalidation bus disabled; other workers' caches expire after their TTL")
+                    return
+                async with db.watch(
+                    self.pipeline(), full_document="updateLookup", resume_after=self.resume_token,
+                    comment=AWAIT_DATA_COMMENT
+                ) as stream:
+                    self.state = "running"
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            self.dispatch(change)
+                        self.resume_token = stream.resume_token
+            except asyncio.CancelledError:
+                self.state = "stopped"
+                raise
+            except Exception as e:
+                self.state = "reconnecting"
+                self.restarts += 1
+                # A token the oplog no longer covers cannot be resumed; start from now instead
+                if isinstance(e, OperationFailure):
+                    self.resume_token = None
+                print(f"Cache invalidation bus interrupted, flushing caches: {type(e).__name__}: {e}")
+                for kind in ("user", "account_status", "balance"):
+                    self.publish(kind, None)
+                await asyncio.sleep(INVALIDATION_BUS_RETRY_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "events": self.events,
+            "restarts": self.restarts,
+            "last_event_at": self.last_event_at
+        }
+
+def drop_cached_user(user_id: Optional[str]):
+    if user_id is None:
+        principal_cache.clear()
+        account_cache.clear()
+    else:
+        invalidate_user(user_id)
+
+def drop_cached_account(account_id: Optional[str]):
+    if account_id is None:
+        account_cache.clear()
+    else:
+        account_cache.invalidate(account_id)
+
+invalidation_bus = InvalidationBus()
+invalidation_bus.subscribe("user", drop_cached_user)
+invalidation_bus.subscribe("account_status", drop_cached_account)
+
+# Analytics rollups
+def rollup_day_id(moment: datetime) -> str:
+    return f"day:{moment:%Y-%m-%d}"
+
+async def record_rollups(totals: dict, daily: Optional[dict] = None):
+    """$inc the global counters and, for each day in `daily`, that day's counters in one round-trip"""
+    operations = [UpdateOne({"_id": "global"}, {"$inc": totals}, upsert=True)] if totals else []
+    for day, counters in (daily or {}).items():
+        operations.append(UpdateOne(
+            {"_id": rollup_day_id(day)},
+            {"$inc": counters, "$setOnInsert": {"date": snapshot_day(day)}},
+            upsert=True
+        ))
+    if operations:
+        await db.analytics_rollups.bulk_write(operations, ordered=False)
+
+async def record_user_rollups(user: dict):
+    await record_rollups(
+        {"users_total": 1, "users_active": 1 if user["status"] == "active" else 0},
+        {user["created_at"]: {"users_new": 1}}
+    )
+
+async def record_transaction_rollups(transactions: List[dict], totals: Optional[dict] = None):
+    daily = {}
+    for transaction in transactions:
+        counters = daily.setdefault(snapshot_day(transaction["created_at"]), {"transactions": 0, "transaction_volume": 0})
+        counters["transactions"] += 1
+        counters["transaction_volume"] += transaction["amount"]
+    await record_rollups(
+        {
+            **(totals or {}),
+            "transactions_total": len(transactions),
+            "transaction_volume": sum(t["amount"] for t in transactions)
+        },
+        daily
+    )
+
+async def compute_rollups() -> dict:
+    """Recompute every rollup document from the base collections, keyed by _id (full collection scans)"""
+    async def total(collection, field):
+        result = await collection.aggregate([{"$group": {"_id": None, "total": {"$sum": f"${field}"}}}]).to_list(length=None)
+        return result[0]["total"] if result else 0
+
+    rollups = {"global": {
+        "_id": "global",
+        "users_total": await db.users.count_documents({}),
+        "users_active": await db.users.count_documents({"status": "active"}),
+        "accounts_total": await db.accounts.count_documents({}),
+        "total_balance": await total(db.accounts, "balance"),
+        "transactions_total": await db.transactions.count_documents({}),
+        "transaction_volume": await total(db.transactions, "amount")
+    }}
+
+    def day_rollup(day: str) -> dict:
+        _id = f"day:{day}"
+        if _id not in rollups:
+            rollups[_id] = {"_id": _id, "date": datetime.strptime(day, "%Y-%m-%d")}
+        return rollups[_id]
+
+    by_day = {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+    async for row in db.users.aggregate([{"$group": {"_id": by_day, "count": {"$sum": 1}}}]):
+        day_rollup(row["_id"])["users_new"] = row["count"]
+    async for row in db.transactions.aggregate([
+        {"$group": {"_id": by_day, "count": {"$sum": 1}, "volume": {"$sum": "$amount"}}}
+    ]):
+        day_rollup(row["_id"]).update({"transactions": row["count"], "transaction_volume": row["volume"]})
+    return rollups
+
+async def rebuild_rollups(write: bool = True) -> List[str]:
+    """Recompute the rollups, report where the stored counters disagree and optionally replace them"""
+    expected = await compute_rollups()
+    stored = {doc["_id"]: doc async for doc in db.analytics_rollups.find({})}
+
+    mismatches = []
+    for _id in sorted(set(expected) | set(stored)):
+        want, have = expected.get(_id, {}), stored.get(_id, {})
+        for field in sorted((set(want) | set(have)) - {"_id", "date", "built_at"}):
+            if abs(want.get(field, 0) - have.get(field, 0)) > 1e-6:
+                mismatches.append(f"{_id}.{field}: stored {have.get(field, 0)}, recomputed {want.get(field, 0)}")
+
+    if write:
+        # Marks a complete rebuild; counters upserted before one ran do not count as built rollups
+        expected["global"]["built_at"] = datetime.utcnow()
+        await db.analytics_rollups.delete_many({})
+        await db.analytics_rollups.insert_many(list(expected.values()))
+    return mismatches
+
+async def balance_before(account_id: str, moment: datetime, database=None) -> Optional[float]:
+    """Closing balance of the last snapshot strictly before `moment`, or None if there is none"""
+    snapshot = await (db if database is None else database).balance_snapshots.find_one(
+        {"account_id": account_id, "date": {"$lt": moment}},
+        sort=[("date", DESCENDING)]
+    )
+    return snapshot["closing_balance"] if snapshot else None
+
+async def balance_from_ledger(account_id: str, moment: datetime, database=None) -> Optional[float]:
+    """Balance at `moment` derived from the current balance and the ledger entries since then"""
+    database = db if database is None else database
+    account = await database.accounts.find_one({"account_id": account_id}, {"_id": 0, "balance": 1})
+    if not account:
+        return None
+    since = {"created_at": {"$gte": moment}}
+    totals = await database.transactions.aggregate([
+        {"$match": {"$or": [{"from_account_id": account_id, **since}, {"to_account_id": account_id, **since}]}},
+        {"$group": {
+            "_id": None,
+            "credits": {"$sum": {"$cond": [{"$eq": ["$to_account_id", account_id]}, "$amount", 0]}},
+            "debits": {"$sum": {"$cond": [{"$eq": ["$from_account_id", account_id]}, "$amount", 0]}}
+        }}
+    ]).to_list(length=1)
+    if not totals:
+        return account["balance"]
+    return account["balance"] - totals[0]["credits"] + totals[0]["debits"]
+
+async def backfill_balance_snapshots(account: dict, since: Optional[datetime] = None) -> int:
+    """Rebuild an account's daily snapshots (from `since` onwards) by walking its history backwards"""
+    account_id = account["account_id"]
+    balance = account["balance"]
+    closing_balances = {snapshot_day(datetime.utcnow()): balance}
+
+    cursor = db.transactions.find(
+        {"$or": [{"from_account_id": account_id}, {"to_account_id": account_id}]},
+        {"_id": 0, "from_account_id": 1, "to_account_id": 1, "amount": 1, "created_at": 1}
+    ).sort([("created_at", DESCENDING), ("transaction_id", DESCENDING)])
+    async for transaction in cursor:
+        if since and transaction["created_at"] < since:
+            break
+        # The first transaction seen for a day is its last, so the running balance is that day's close
+        closing_balances.setdefault(snapshot_day(transaction["created_at"]), balance)
+        if transaction.get("to_account_id") == account_id:
+            balance -= transaction["amount"]
+        if transaction.get("from_account_id") == account_id:
+            balance += transaction["amount"]
+    if not since or account["created_at"] >= since:
+        closing_balances.setdefault(snapshot_day(account["created_at"]), balance)
+
+    version = account.get("balance_version", 0)
+    operations = [
+        UpdateOne(
+            {"account_id": account_id, "date": day, "version": {"$lte": version}},
+            {"$set": {"closing_balance": closing_balance, "version": version, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        for day, closing_balance in closing_balances.items()
+    ]
+    try:
+        await db.balance_snapshots.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys mean a live balance change already wrote a newer snapshot for that day
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+    return len(operations)
+
+# Month-end processing
+MONTH_END_NAMESPACE = uuid.UUID("6f1c1f36-3d0b-4f55-9b3a-0b6f9b7a5e21")
+MONTH_END_PROJECTION = {
+    "_id": 0, "account_id": 1, "user_id": 1, "account_type": 1, "balance": 1, "balance_version": 1,
+    "interest_rate": 1, "monthly_fee": 1, "month_end_postings": 1, "month_end_period": 1, "month_end_amount": 1,
+    "created_at": 1
+}
+
+def period_start(period: str) -> datetime:
+    year, month = (int(part) for part in period.split("-"))
+    return datetime(year, month, 1)
+
+def period_end(period: str) -> datetime:
+    """First instant after the month named by `period` ("YYYY-MM")"""
+    start = period_start(period)
+    return datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+
+def month_end_period_error(period: str) -> Optional[str]:
+    """Why `period` cannot be posted now, or None; postings use live balances, so only the current month can"""
+    current_period = datetime.utcnow().strftime("%Y-%m")
+    if period != current_period:
+        return f"Only the current period ({current_period}) can be posted"
+    return None
+
+def posted_month_end_amount(account: dict, period: str) -> Optional[float]:
+    """Amount already posted to an account for `period`, or None if that period has not been posted"""
+    postings = account.get("month_end_postings") or {}
+    if period in postings:
+        return postings[period]
+    # Accounts posted before postings were kept per period only remember the latest one
+    if account.get("month_end_period") == period:
+        return account["month_end_amount"]
+    return None
+
+def month_end_entry(account: dict, amount: float, period: str) -> dict:
+    """Ledger row for an account's month-end posting; its id is derived from the period so it is written once"""
+    entry = {
+        "transaction_id": str(uuid.uuid5(MONTH_END_NAMESPACE, f"{period}:{account['account_id']}")),
+        "amount": abs(amount),
+        "status": "completed",
+        "user_id": account["user_id"],
+        "period": period,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+    if amount > 0:
+        entry.update({
+            "from_account_id": None,
+            "to_account_id": account["account_id"],
+            "transfer_type": "interest_credit",
+            "description": "Monthly interest credit"
+        })
+    else:
+        entry.update({
+            "from_account_id": account["account_id"],
+            "to_account_id": None,
+            "transfer_type": "monthly_fee",
+            "description": "Monthly maintenance fee"
+        })
+    return entry
+
+def month_end_amount(account: dict) -> float:
+    """Interest credit (positive) or maintenance fee (negative) due on an account, or 0"""
+    if account["account_type"] == "savings":
+        return max(account["balance"] * (account["interest_rate"] / 12), 0)
+    if account["monthly_fee"] > 0 and account["balance"] >= account["monthly_fee"]:
+        return -account["monthly_fee"]
+    return 0
+
+async def apply_month_end_chunk(accounts: List[dict], period: str) -> dict:
+    """Post interest or fees for a chunk of accounts, at most once per account and period"""
+    postings = []
+    repairs = []
+    end = period_end(period)
+    for account in accounts:
+        if account.get("created_at") and account["created_at"] >= end:
+            continue
+        posted = posted_month_end_amount(account, period)
+        if posted is not None:
+            # Posted by an earlier, interrupted run; make sure its ledger row and snapshot exist
+            repairs.append((account, posted))
+            continue
+        amount = month_end_amount(account)
+        if amount:
+            postings.append((account, amount))
+
+    applied = []
+    while postings:
+        now = datetime.utcnow()
+        result = await db.accounts.bulk_write([
+            UpdateOne(
+                {
+                    "account_id": account["account_id"],
+                    "balance_version": account.get("balance_version", {"$exists": False}),
+                    f"month_end_postings.{period}": {"$exists": False},
+                    "month_end_period": {"$ne": period}
+                },
+                {
+                    "$inc": {"balance": amount, "balance_version": 1},
+                    "$set": {"updated_at": now, f"month_end_postings.{period}": amount}
+                }
             )
-            
-            # Create fee transaction
-            create_transaction({
-                "from_account_id": account_id,
-                "to_account_id": None,
-                "amount": account["monthly_fee"],
-                "transfer_type": "monthly_fee",
-                "description": "Monthly maintenance fee",
-                "status": "completed",
-                "user_id": account["user_id"]
-            })
+            for account, amount in postings
+        ], ordered=False)
+        if result.matched_count == len(postings):
+            applied += postings
+            break
+
+        # Some balances moved since they were read: keep the ones that landed and re-read the rest
+        stamped = set(await db.accounts.distinct("account_id", {
+            "account_id": {"$in": [account["account_id"] for account, _ in postings]},
+            f"month_end_postings.{period}": {"$exists": True}
+        }))
+        moved = [account["account_id"] for account, _ in postings if account["account_id"] not in stamped]
+        applied += [(account, amount) for account, amount in postings if account["account_id"] in stamped]
+        reloaded = await db.accounts.find({"account_id": {"$in": moved}}, MONTH_END_PROJECTION).to_list(length=None)
+        postings = []
+        for account in reloaded:
+            if posted_month_end_amount(account, period) is None and month_end_amount(account):
+                postings.append((account, month_end_amount(account)))
+
+    entries = [month_end_entry(account, amount, period) for account, amount in applied]
+    entries += [month_end_entry(account, amount, period) for account, amount in repairs]
+    if entries:
+        inserted = entries
+        try:
+            await db.transactions.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            duplicates = {error["index"] for error in e.details["writeErrors"]}
+            # Only repairs may find their ledger row already written; a posting this call applied must not
+            conflicting = [entries[i]["transaction_id"] for i in duplicates if i < len(applied)]
+            if conflicting:
+                raise RuntimeError(
+                    f"Month-end {period} ledger rows already exist for balances posted just now: {', '.join(conflicting)}"
+                )
+            inserted = [entry for i, entry in enumerate(entries) if i not in duplicates]
+        if inserted:
+            await record_transaction_rollups(inserted)
+    if applied:
+        await record_rollups({"total_balance": sum(amount for _, amount in applied)})
+    snapshots = [
+        (account["account_id"], account["balance"] + amount, account.get("balance_version", 0) + 1)
+        for account, amount in applied
+    ]
+    snapshots += [(account["account_id"], account["balance"], account.get("balance_version", 0)) for account, _ in repairs]
+    if snapshots:
+        await record_balance_snapshots(snapshots)
+    return {
+        "postings": len(applied),
+        "interest_applied": sum(1 for _, amount in applied if amount > 0),
+        "fees_applied": sum(1 for _, amount in applied if amount < 0)
+    }
+
+async def run_month_end_job(job_id: str):
+    """Process a month-end job from its checkpoint, persisting progress after every chunk"""
+    job = await db.jobs.find_one({"job_id": job_id})
+    period = job["period"]
+    batch_size = job["batch_size"]
+
+    query = {"account_type": {"$in": ["savings", "checking"]}, "status": "active"}
+    if job.get("checkpoint"):
+        query["account_id"] = {"$gt": job["checkpoint"]}
+    cursor = db.accounts.find(query, MONTH_END_PROJECTION).sort("account_id", ASCENDING).hint(
+        "account_id_unique"
+    ).batch_size(batch_size)
+
+    async def process(chunk: List[dict]):
+        # A job resumed or still running after its month ended must not post on the next month's balances
+        period_error = month_end_period_error(period)
+        if period_error:
+            raise RuntimeError(period_error)
+        started = time.perf_counter()
+        applied = await apply_month_end_chunk(chunk, period)
+        await db.jobs.update_one(
+            {"job_id": job_id},
+            {
+                "$set": {
+                    "checkpoint": chunk[-1]["account_id"],
+                    "updated_at": datetime.utcnow(),
+                    "lease_expires_at": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+                },
+                "$inc": {
+                    "counts.accounts": len(chunk),
+                    "counts.interest_applied": applied["interest_applied"],
+                    "counts.fees_applied": applied["fees_applied"],
+                    "counts.postings": applied["postings"],
+                    "processing_seconds": time.perf_counter() - started
+                }
+            }
+        )
+
+    try:
+        chunk = []
+        async for account in cursor:
+            chunk.append(account)
+            if len(chunk) >= batch_size:
+                await process(chunk)
+                chunk = []
+        if chunk:
+            await process(chunk)
+    except Exception as e:
+        await db.jobs.update_one(
+            {"job_id": job_id},
+            {"$set": {"status": "failed", "error": str(e), "lease_expires_at": None, "updated_at": datetime.utcnow()}}
+        )
+        print(f"Month-end job {job_id} failed: {e}")
+        return
+
+    job = await db.jobs.find_one({"job_id": job_id})
+    processing_seconds = job.get("processing_seconds", 0)
+    await db.jobs.update_one(
+        {"job_id": job_id},
+        {"$set": {
+            "status": "completed",
+            "completed_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+            "lease_expires_at": None,
+            "accounts_per_sec": round(job["counts"]["accounts"] / processing_seconds, 1) if processing_seconds else None
+        }}
+    )
+
+# Background jobs
+background_tasks = set()
+
+def schedule_job(job_id: str):
+    task = asyncio.create_task(run_month_end_job(job_id))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def claim_job(job_id: str, statuses: List[str]) -> Optional[dict]:
+    """Take over a job in one of `statuses` whose previous runner stopped renewing its lease"""
+    now = datetime.utcnow()
+    return await db.jobs.find_one_and_update(
+        {
+            "job_id": job_id,
+            "status": {"$in": statuses},
+            "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]
+        },
+        {"$set": {
+            "status": "running",
+            "error": None,
+            "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            "updated_at": now
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def start_month_end_job(period: str, batch_size: int, user_id: str) -> dict:
+    """Create and schedule the job for `period`, or return the one already in progress"""
+    existing = await db.jobs.find_one({"type": "month_end", "period": period, "status": "running"})
+    if existing:
+        # Resume it if its runner died, otherwise report on the run in progress
+        claimed = await claim_job(existing["job_id"], ["running"])
+        if claimed:
+            schedule_job(claimed["job_id"])
+            return claimed
+        return existing
+
+    now = datetime.utcnow()
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "type": "month_end",
+        "period": period,
+        "status": "running",
+        "batch_size": batch_size,
+        "checkpoint": None,
+        "counts": {"accounts": 0, "interest_applied": 0, "fees_applied": 0, "postings": 0},
+        "processing_seconds": 0,
+        "requested_by": user_id,
+        "error": None,
+        "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+        "created_at": now,
+        "updated_at": now
+    }
+    await db.jobs.insert_one(job)
+    schedule_job(job["job_id"])
+    return job
+
 
 def serialize_mongo_doc(doc):
     """Convert MongoDB document to JSON serializable format"""
@@ -232,21 +1674,757 @@ def serialize_mongo_doc(doc):
         return result
     return doc
 
+# Idempotency keys
+# scoped key -> task executing the first request seen for it in this process
+idempotency_in_flight = {}
+# The scoped key of the request being executed; its ledger rows are tagged with it
+idempotency_scope = contextvars.ContextVar("idempotency_scope", default=None)
+
+def tag_idempotent(transactions: List[dict]) -> List[dict]:
+    key = idempotency_scope.get()
+    if key:
+        for transaction in transactions:
+            transaction["idempotency_key"] = key
+    return transactions
+
+async def stage_idempotent_response(body: dict, session=None):
+    """Store the response ahead of the ledger write it describes, in the same transaction"""
+    key = idempotency_scope.get()
+    if key:
+        await db.idempotency_keys.update_one(
+            {"_id": key}, {"$set": {"status": "committing", "status_code": 200, "body": jsonable_encoder(body)}},
+            session=session
+        )
+
+async def settle_idempotency_key(key: str) -> Optional[dict]:
+    """Complete a key whose request reached the ledger before failing or dying; None if it wrote nothing"""
+    if not await db.transactions.find_one({"idempotency_key": key}, {"_id": 1}):
+        return None
+    return await db.idempotency_keys.find_one_and_update(
+        {"_id": key, "body": {"$exists": True}},
+        {"$set": {"status": "completed"}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def idempotency_lease_expired(record: dict) -> bool:
+    # Keys stored before leases were recorded fall back to their creation time
+    expires_at = record.get("lease_expires_at") or record["created_at"] + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+    return expires_at < datetime.utcnow()
+
+async def await_stored_response(key: str) -> Optional[dict]:
+    """Poll for a response another process is still producing for `key`; None if there is none to wait for"""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        record = await db.idempotency_keys.find_one({"_id": key})
+        if not record:
+            return None  # The original request failed; nothing was stored
+        if record["status"] == "completed":
+            return record
+        if idempotency_lease_expired(record):
+            return None  # Its worker died; the caller takes the key over
+    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+async def take_over_idempotency_key(record: dict) -> bool:
+    """Claim an in-progress key whose lease expired; only one retry can win"""
+    now = datetime.utcnow()
+    lease = {"lease_expires_at": record["lease_expires_at"]} if record.get("lease_expires_at") else {
+        "lease_expires_at": {"$exists": False}
+    }
+    result = await db.idempotency_keys.update_one(
+        {"_id": record["_id"], "status": {"$ne": "completed"}, **lease},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}}
+    )
+    return result.modified_count == 1
+
+async def execute_idempotent(key: str, fingerprint: str, execute) -> tuple:
+    """Run `execute` at most once for `key` across processes; returns (stored response, replayed)"""
+    try:
+        now = datetime.utcnow()
+        await db.idempotency_keys.insert_one({
+            "_id": key,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "lease_expires_at": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        record = await db.idempotency_keys.find_one({"_id": key})
+        if record and record["status"] != "completed":
+            if record["fingerprint"] != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            if not (idempotency_lease_expired(record) and await take_over_idempotency_key(record)):
+                record = await await_stored_response(key)
+                if record:
+                    return record, True
+                return await execute_idempotent(key, fingerprint, execute)
+            # Its worker died; replay what it committed instead of running the request again
+            record = await settle_idempotency_key(key)
+            if record:
+                return record, True
+        elif record:
+            return record, True
+        else:
+            return await execute_idempotent(key, fingerprint, execute)
+    
+    async def renew_lease():
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+            await db.idempotency_keys.update_one(
+                {"_id": key, "status": {"$ne": "completed"}},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}}
+            )
+    
+    heartbeat = asyncio.create_task(renew_lease())
+    idempotency_scope.set(key)
+    try:
+        body = jsonable_encoder(await execute())
+    except BaseException:
+        # Only a request that wrote nothing may be retried with the same key
+        if not await settle_idempotency_key(key):
+            await db.idempotency_keys.delete_one({"_id": key})
+        raise
+    finally:
+        heartbeat.cancel()
+    record = {"_id": key, "fingerprint": fingerprint, "status": "completed", "status_code": 200, "body": body}
+    await db.idempotency_keys.update_one(
+        {"_id": key}, {"$set": {"status": "completed", "status_code": 200, "body": body}}
+    )
+    return record, False
+
+async def run_idempotent(idempotency_key: Optional[str], current_user: dict, endpoint: str, payload: BaseModel, execute):
+    """Execute a write once per Idempotency-Key and replay its response for retries"""
+    if idempotency_key is None:
+        return await execute()
+    if not 0 < len(idempotency_key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-255 characters")
+    
+    key = f"{current_user['user_id']}:{endpoint}:{idempotency_key}"
+    fingerprint = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+    record = idempotency_cache.get(key)
+    replayed = True
+    if record is None:
+        task = idempotency_in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(execute_idempotent(key, fingerprint, execute))
+            idempotency_in_flight[key] = task
+            task.add_done_callback(lambda _: idempotency_in_flight.pop(key, None))
+            # Shielded so a client disconnecting mid-request cannot leave the key half-processed
+            record, replayed = await asyncio.shield(task)
+        else:
+            record, _ = await asyncio.shield(task)
+        idempotency_cache.set(key, record)
+    
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    if not replayed:
+        return record["body"]
+    return JSONResponse(status_code=record["status_code"], content=record["body"], headers={"Idempotent-Replayed": "true"})
+
+# Keyset pagination
+def encode_cursor(created_at: datetime, key: str) -> str:
+    raw = json.dumps({"created_at": created_at.isoformat(), "key": key})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["created_at"]), raw["key"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_query(branches: List[dict], key_field: str, cursor: Optional[str] = None) -> dict:
+    """OR together query branches, continuing after `cursor` in (created_at, key_field) order"""
+    if cursor:
+        created_at, key = decode_cursor(cursor)
+        expanded = []
+        for branch in branches:
+            expanded.append({**branch, "created_at": {**branch.get("created_at", {}), "$lt": created_at}})
+            expanded.append({**branch, "created_at": created_at, key_field: {"$lt": key}})
+        branches = expanded
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+async def fetch_page(collection, query: dict, key_field: str, limit: int, projection: Optional[dict] = None):
+    """Return up to `limit` documents newest first, plus the cursor for the next page (or None)"""
+    projection = {**(projection or {}), "_id": 0}
+    documents = await collection.find(query, projection).sort(
+        [("created_at", DESCENDING), (key_field, DESCENDING)]
+    ).limit(limit + 1).to_list(length=None)
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1]["created_at"], documents[-1][key_field])
+    return documents, next_cursor
+
+def transaction_filters(start_date: Optional[str], end_date: Optional[str], transaction_type: Optional[str] = None) -> dict:
+    """Build the created_at range and transfer_type filters shared by the transaction list routes"""
+    filters = {}
+    if start_date:
+        filters["created_at"] = {"$gte": datetime.fromisoformat(start_date)}
+    if end_date:
+        if "created_at" not in filters:
+            filters["created_at"] = {}
+        filters["created_at"]["$lte"] = datetime.fromisoformat(end_date)
+    if transaction_type:
+        filters["transfer_type"] = transaction_type
+    return filters
+
+# Sparse fieldsets: fields a client may select with ?fields= per resource
+FIELD_ALLOW_LISTS = {
+    "accounts": {
+        "account_id", "user_id", "account_number", "account_type", "balance", "status", "interest_rate",
+        "monthly_fee", "minimum_balance", "created_at", "updated_at"
+    },
+    "admin_accounts": {
+        "account_id", "account_number", "account_type", "balance", "status", "interest_rate", "monthly_fee",
+        "created_at", "user_name", "user_email"
+    },
+    "transactions": {
+        "transaction_id", "from_account_id", "to_account_id", "amount", "transfer_type", "description", "status",
+        "confirmation_number", "user_id", "admin_user_id", "recipient_name", "recipient_bank", "routing_number",
+        "estimated_arrival", "backdated", "created_at", "updated_at"
+    },
+    "users": {
+        "user_id", "email", "first_name", "last_name", "phone", "address", "date_of_birth", "role", "status",
+        "failed_login_attempts", "last_login", "created_at", "updated_at"
+    },
+}
+
+def requested_fields(fields: Optional[str], resource: str) -> Optional[List[str]]:
+    """Parse a comma-separated ?fields= value against the resource's allow-list (None: all fields)"""
+    if fields is None:
+        return None
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in FIELD_ALLOW_LISTS[resource]]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "fields must name at least one field"
+        )
+    return requested
+
+def field_projection(fields: Optional[str], resource: str, required: tuple = ()) -> Optional[dict]:
+    """Translate ?fields= into a Mongo projection; `required` fields (cursor keys) are always included"""
+    requested = requested_fields(fields, resource)
+    if requested is None:
+        return None
+    return {field: 1 for field in [*requested, *required]}
+
+# User directory
+def user_search_terms(user: dict) -> List[str]:
+    """Lower-cased prefixes the admin directory search matches on (multikey-indexed as search_terms)"""
+    first_name = (user.get("first_name") or "").strip().lower()
+    last_name = (user.get("last_name") or "").strip().lower()
+    phone = (user.get("phone") or "").strip().lower()
+    terms = [
+        (user.get("email") or "").strip().lower(),
+        first_name,
+        last_name,
+        f"{first_name} {last_name}".strip(),
+        phone,
+        re.sub(r"\D", "", phone)
+    ]
+    return sorted({term for term in terms if term})
+
+# Queries made only of digits and phone punctuation also match the digits-only phone term
+PHONE_QUERY = re.compile(r"[\d\s+().-]+")
+
+def user_directory_filter(q: Optional[str], user_status: Optional[str], role: Optional[str]) -> dict:
+    """Build an index-backed filter: anchored, case-sensitive regexes over the lower-cased search_terms"""
+    filters = {}
+    if q and q.strip():
+        prefixes = {q.strip().lower()}
+        if PHONE_QUERY.fullmatch(q.strip()):
+            prefixes.add(re.sub(r"\D", "", q))
+        prefixes.discard("")
+        filters["search_terms"] = {"$in": [re.compile("^" + re.escape(prefix)) for prefix in prefixes]}
+    if user_status:
+        filters["status"] = user_status
+    if role:
+        filters["role"] = role
+    return filters
+
+async def count_matching(collection, filters: dict) -> dict:
+    """Count matches without a collection scan: metadata for no filter, a capped index count otherwise"""
+    if not filters:
+        return {"total": await collection.estimated_document_count(), "total_exact": True}
+    total = await collection.count_documents(filters, limit=DIRECTORY_COUNT_LIMIT)
+    return {"total": total, "total_exact": total < DIRECTORY_COUNT_LIMIT}
+
+async def backfill_user_search_terms() -> int:
+    """Add search_terms to users created before the directory search existed"""
+    updated = 0
+    operations = []
+    async for user in db.users.find(
+        {"search_terms": {"$exists": False}},
+        {"user_id": 1, "email": 1, "first_name": 1, "last_name": 1, "phone": 1}
+    ):
+        operations.append(UpdateOne({"user_id": user["user_id"]}, {"$set": {"search_terms": user_search_terms(user)}}))
+        if len(operations) >= BULK_OPERATIONS_BATCH_SIZE:
+            updated += (await db.users.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await db.users.bulk_write(operations, ordered=False)).modified_count
+    return updated
+
+async def backfill_account_owners() -> int:
+    """Denormalize owner name/email onto accounts created before they were stored there"""
+    updated = 0
+    async for user in db.users.find({}, {"user_id": 1, "first_name": 1, "last_name": 1, "email": 1}):
+        result = await db.accounts.update_many(
+            {"user_id": user["user_id"], "user_email": {"$exists": False}}, {"$set": account_owner_fields(user)}
+        )
+        updated += result.modified_count
+    return updated
+
+# Streaming export
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_CSV_FIELDS = [
+    "transaction_id", "created_at", "from_account_id", "to_account_id", "amount", "transfer_type",
+    "description", "status", "confirmation_number", "user_id", "admin_user_id", "recipient_name",
+    "recipient_bank", "routing_number", "estimated_arrival", "backdated"
+]
+
+async def stream_transactions(query: dict, export_format: str):
+    """Yield the export one cursor batch at a time so memory stays flat regardless of row count"""
+    cursor = db.transactions.find(query, {"_id": 0}).sort(
+        [("created_at", ASCENDING), ("transaction_id", ASCENDING)]
+    ).batch_size(EXPORT_BATCH_SIZE)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS, extrasaction="ignore")
+    if export_format == "csv":
+        writer.writeheader()
+
+    rows = 0
+    async for transaction in cursor:
+        transaction = serialize_mongo_doc(transaction)
+        if export_format == "csv":
+            writer.writerow(transaction)
+        else:
+            buffer.write(json.dumps(transaction, default=str))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_response(query: dict, export_format: str, filename: str) -> StreamingResponse:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {export_format}")
+    return StreamingResponse(
+        stream_transactions(query, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
+
+# Credit/debit CSV import
+CREDIT_DEBIT_IMPORT_FIELDS = ["account_id", "amount", "type", "description", "backdate"]
+CREDIT_DEBIT_IMPORT_ATTEMPTS = 3
+
+def admin_transaction_date(backdate: Optional[str], current_user: dict) -> datetime:
+    """Only super admins may backdate; an unparseable backdate falls back to now"""
+    if backdate and current_user["role"] == "super_admin":
+        try:
+            return datetime.fromisoformat(backdate)
+        except ValueError:
+            pass  # Use current date if invalid backdate
+    return datetime.utcnow()
+
+async def rebuild_backdated_snapshots(transactions: List[dict]):
+    """Rewrite the snapshots of accounts with backdated entries from the earliest backdated day onwards"""
+    today = snapshot_day(datetime.utcnow())
+    since = {}
+    for transaction in transactions:
+        day = snapshot_day(transaction["created_at"])
+        if day < today:
+            account_id = transaction["to_account_id"] or transaction["from_account_id"]
+            since[account_id] = min(day, since.get(account_id, day))
+    if not since:
+        return
+    async for account in db.accounts.find(
+        {"account_id": {"$in": list(since)}},
+        {"_id": 0, "account_id": 1, "balance": 1, "balance_version": 1, "created_at": 1}
+    ):
+        await backfill_balance_snapshots(account, since[account["account_id"]])
+
+def admin_transaction(transaction_data: AdminCreditDebit, current_user: dict) -> dict:
+    """Build the ledger row for an admin credit/debit (not yet inserted)"""
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "from_account_id": None if transaction_data.transaction_type == "credit" else transaction_data.account_id,
+        "to_account_id": transaction_data.account_id if transaction_data.transaction_type == "credit" else None,
+        "amount": transaction_data.amount,
+        "transfer_type": "admin_" + transaction_data.transaction_type,
+        "description": transaction_data.description,
+        "status": "completed",
+        "admin_user_id": current_user["user_id"],
+        "confirmation_number": str(uuid.uuid4())[:8].upper(),
+        "created_at": admin_transaction_date(transaction_data.backdate, current_user),
+        "updated_at": datetime.utcnow(),
+        "backdated": transaction_data.backdate is not None
+    }
+
+def credit_debit_amount_error(amount: float) -> Optional[str]:
+    """Why an admin credit/debit amount is unacceptable, or None; float() also parses inf and nan"""
+    if not math.isfinite(amount) or amount <= 0:
+        return "amount must be a positive number"
+    if amount > CREDIT_DEBIT_MAX_AMOUNT:
+        return f"amount must not exceed {CREDIT_DEBIT_MAX_AMOUNT:g}"
+    return None
+
+def parse_credit_debit_row(row: dict) -> AdminCreditDebit:
+    """Validate one CSV row, raising ValueError with a message for the error report"""
+    if None in row or any(value is None for value in row.values()):
+        raise ValueError("Wrong number of columns")
+    account_id = (row.get("account_id") or "").strip()
+    if not account_id:
+        raise ValueError("Missing account_id")
+    transaction_type = (row.get("type") or "").strip().lower()
+    if transaction_type not in ["credit", "debit"]:
+        raise ValueError("type must be credit or debit")
+    try:
+        amount = float(row.get("amount") or "")
+    except ValueError:
+        raise ValueError("amount must be a number")
+    amount_error = credit_debit_amount_error(amount)
+    if amount_error:
+        raise ValueError(amount_error)
+    return AdminCreditDebit(
+        account_id=account_id,
+        amount=amount,
+        transaction_type=transaction_type,
+        description=(row.get("description") or "").strip(),
+        backdate=(row.get("backdate") or "").strip() or None
+    )
+
+async def apply_credit_debit_chunk(rows: List[tuple], current_user: dict) -> List[dict]:
+    """Apply (line, AdminCreditDebit) rows with one bulk_write per attempt; returns their errors"""
+    errors = []
+    pending = rows
+    for _ in range(CREDIT_DEBIT_IMPORT_ATTEMPTS):
+        async def apply_attempt(session):
+            account_ids = list({data.account_id for _, data in pending})
+            accounts = {
+                account["account_id"]: account
+                for account in await db.accounts.find(
+                    {"account_id": {"$in": account_ids}}, {"account_id": 1, "balance": 1, "balance_version": 1},
+                    session=session
+                ).to_list(length=None)
+            }
+            rejected, accepted, balances = [], {}, {}
+            for line, data in pending:
+                account = accounts.get(data.account_id)
+                if not account:
+                    rejected.append({"line": line, "error": "Account not found"})
+                    continue
+                balance = balances.get(data.account_id, account["balance"])
+                if data.transaction_type == "debit" and balance < data.amount:
+                    rejected.append({"line": line, "error": "Insufficient funds for debit", "account_id": data.account_id})
+                    continue
+                balances[data.account_id] = balance + (data.amount if data.transaction_type == "credit" else -data.amount)
+                accepted.setdefault(data.account_id, []).append((line, data))
+            
+            markers = {account_id: str(uuid.uuid4()) for account_id in accepted}
+            applied = set(accepted)
+            if accepted:
+                result = await db.accounts.bulk_write([
+                    UpdateOne(
+                        {
+                            "account_id": account_id,
+                            "balance_version": accounts[account_id].get("balance_version", {"$exists": False})
+                        },
+                        {
+                            "$inc": {"balance": balances[account_id] - accounts[account_id]["balance"], "balance_version": 1},
+                            "$set": {"updated_at": datetime.utcnow(), "last_adjustment_id": markers[account_id]}
+                        }
+                    )
+                    for account_id in accepted
+                ], ordered=False, session=session)
+                if result.matched_count < len(accepted):
+                    # Some accounts changed after they were read; find out which updates landed
+                    applied = {
+                        account["account_id"]
+                        for account in await db.accounts.find(
+                            {"last_adjustment_id": {"$in": list(markers.values())}}, {"account_id": 1}, session=session
+                        ).to_list(length=None)
+                    }
+            transactions = [
+                admin_transaction(data, current_user) for account_id in applied for _, data in accepted[account_id]
+            ]
+            if transactions:
+                await db.transactions.insert_many(transactions, ordered=False, session=session)
+            return accounts, rejected, accepted, balances, applied, transactions
+        
+        accounts, rejected, accepted, balances, applied, transactions = await run_in_transaction(apply_attempt)
+        await record_balance_changes([
+            (
+                {
+                    "account_id": account_id,
+                    "balance": balances[account_id],
+                    "balance_version": accounts[account_id].get("balance_version", 0) + 1
+                },
+                balances[account_id] - accounts[account_id]["balance"]
+            )
+            for account_id in applied
+        ], transactions)
+        await rebuild_backdated_snapshots(transactions)
+        
+        # Rows of accounts whose update was beaten by a concurrent write are re-checked from fresh balances
+        conflicted = set(accepted) - applied
+        errors.extend(error for error in rejected if error.get("account_id") not in conflicted)
+        pending = [(line, data) for line, data in pending if data.account_id in conflicted]
+        if not pending:
+            break
+    errors.extend({"line": line, "error": "Account was modified concurrently, retry this row"} for line, _ in pending)
+    for error in errors:
+        error.pop("account_id", None)
+    return errors
+
+async def import_credit_debit_csv(upload: UploadFile, current_user: dict) -> dict:
+    """Stream an uploaded CSV through apply_credit_debit_chunk without reading it into memory"""
+    # UploadFile spools large bodies to disk; rows are decoded and parsed lazily from there
+    reader = csv.DictReader(codecs.iterdecode(upload.file, "utf-8-sig"))
+    missing = [field for field in CREDIT_DEBIT_IMPORT_FIELDS if field != "backdate" and field not in (reader.fieldnames or [])]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"CSV is missing columns: {', '.join(missing)}")
+    
+    total_rows = 0
+    applied = 0
+    errors = []
+    chunk = []
+    
+    async def flush():
+        nonlocal applied
+        chunk_errors = await apply_credit_debit_chunk(chunk, current_user)
+        applied += len(chunk) - len(chunk_errors)
+        errors.extend(chunk_errors)
+        chunk.clear()
+    
+    try:
+        for row in reader:
+            total_rows += 1
+            try:
+                chunk.append((reader.line_num, parse_credit_debit_row(row)))
+            except ValueError as e:
+                errors.append({"line": reader.line_num, "error": str(e)})
+            if len(chunk) >= CREDIT_DEBIT_IMPORT_CHUNK_SIZE:
+                await flush()
+    except UnicodeDecodeError:
+        errors.append({"line": reader.line_num + 1, "error": "File is not valid UTF-8; import stopped here"})
+    if chunk:
+        await flush()
+    
+    errors.sort(key=lambda error: error["line"])
+    return {
+        "message": "Credit/debit import processed",
+        "rows": total_rows,
+        "applied": applied,
+        "failed": len(errors),
+        "errors": errors[:CREDIT_DEBIT_IMPORT_MAX_ERRORS],
+        "errors_truncated": len(errors) > CREDIT_DEBIT_IMPORT_MAX_ERRORS
+    }
+
+# Index definitions
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("user_id", DESCENDING)], name="created_at_user_id"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("user_id", DESCENDING)],
+                   name="status_created_at_user_id"),
+        IndexModel([("role", ASCENDING), ("created_at", DESCENDING), ("user_id", DESCENDING)],
+                   name="role_created_at_user_id"),
+        IndexModel([("search_terms", ASCENDING), ("created_at", DESCENDING), ("user_id", DESCENDING)],
+                   name="search_terms_created_at_user_id"),
+        IndexModel([("last_login", DESCENDING)], name="last_login"),
+    ],
+    "accounts": [
+        IndexModel([("account_id", ASCENDING)], name="account_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("account_type", ASCENDING), ("status", ASCENDING)], name="account_type_status"),
+        IndexModel([("created_at", DESCENDING), ("account_id", DESCENDING)], name="created_at_account_id"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("account_id", DESCENDING)],
+                   name="status_created_at_account_id"),
+        IndexModel([("account_type", ASCENDING), ("created_at", DESCENDING), ("account_id", DESCENDING)],
+                   name="account_type_created_at_account_id"),
+        IndexModel([("user_email", ASCENDING)], name="user_email"),
+        IndexModel([("balance", ASCENDING)], name="balance"),
+    ],
+    "transactions": [
+        IndexModel([("transaction_id", ASCENDING)], name="transaction_id_unique", unique=True),
+        IndexModel([("from_account_id", ASCENDING), ("created_at", DESCENDING), ("transaction_id", DESCENDING)],
+                   name="from_account_history"),
+        IndexModel([("to_account_id", ASCENDING), ("created_at", DESCENDING), ("transaction_id", DESCENDING)],
+                   name="to_account_history"),
+        IndexModel([("created_at", DESCENDING), ("transaction_id", DESCENDING)], name="created_at_transaction_id"),
+        IndexModel([("idempotency_key", ASCENDING)], name="idempotency_key", sparse=True),
+    ],
+    "jobs": [
+        IndexModel([("job_id", ASCENDING)], name="job_id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease"),
+    ],
+    "balance_snapshots": [
+        IndexModel([("account_id", ASCENDING), ("date", DESCENDING)], name="account_date_unique", unique=True),
+    ],
+    "idempotency_keys": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=IDEMPOTENCY_KEY_TTL_SECONDS),
+    ],
+}
+
+# Representative query shapes issued by the API, used to check that each one is index-backed
+QUERY_SHAPES = [
+    ("get_current_user", "users", {"user_id": "sample"}, None),
+    ("login/register by email", "users", {"email": "sample@example.com"}, None),
+    ("cache warm-up recent logins", "users", {"last_login": {"$ne": None}}, [("last_login", -1)]),
+    ("admin user directory", "users", {}, [("created_at", -1), ("user_id", -1)]),
+    ("admin user directory by status", "users", {"status": "active"}, [("created_at", -1), ("user_id", -1)]),
+    ("admin user directory by role", "users", {"role": "customer"}, [("created_at", -1), ("user_id", -1)]),
+    ("admin user directory search", "users",
+     {"search_terms": {"$in": [re.compile("^sample")]}}, [("created_at", -1), ("user_id", -1)]),
+    ("account by id", "accounts", {"account_id": "sample"}, None),
+    ("accounts by ids", "accounts", {"account_id": {"$in": ["sample"]}}, None),
+    ("statement balance snapshot", "balance_snapshots",
+     {"account_id": "sample", "date": {"$lt": datetime(2000, 1, 1)}}, [("date", -1)]),
+    ("accounts by user", "accounts", {"user_id": "sample"}, None),
+    ("cache warm-up accounts", "accounts", {"user_id": {"$in": ["sample"]}}, None),
+    ("admin accounts", "accounts", {}, [("created_at", -1), ("account_id", -1)]),
+    ("admin accounts by status", "accounts", {"status": "active"}, [("created_at", -1), ("account_id", -1)]),
+    ("admin accounts by type", "accounts", {"account_type": "savings"}, [("created_at", -1), ("account_id", -1)]),
+    ("admin accounts by owner", "accounts", {"user_email": "sample@example.com"}, [("created_at", -1), ("account_id", -1)]),
+    ("admin accounts by balance", "accounts", {"balance": {"$gte": 1000000}}, [("created_at", -1), ("account_id", -1)]),
+    ("month-end job accounts", "accounts",
+     {"account_type": {"$in": ["savings", "checking"]}, "status": "active", "account_id": {"$gt": "sample"}},
+     [("account_id", 1)]),
+    ("account history", "transactions",
+     {"$or": [{"from_account_id": "sample"}, {"to_account_id": "sample"}]}, [("created_at", -1), ("transaction_id", -1)]),
+    ("account history next page", "transactions",
+     {"$or": [{"from_account_id": "sample", "created_at": {"$lt": datetime(2000, 1, 1)}},
+              {"from_account_id": "sample", "created_at": datetime(2000, 1, 1), "transaction_id": {"$lt": "sample"}},
+              {"to_account_id": "sample", "created_at": {"$lt": datetime(2000, 1, 1)}},
+              {"to_account_id": "sample", "created_at": datetime(2000, 1, 1), "transaction_id": {"$lt": "sample"}}]},
+     [("created_at", -1), ("transaction_id", -1)]),
+    ("account statement", "transactions",
+     {"$or": [{"from_account_id": "sample"}, {"to_account_id": "sample"}],
+      "created_at": {"$gte": datetime(2000, 1, 1), "$lte": datetime(2000, 1, 31)}}, [("created_at", 1)]),
+    ("statement balance from ledger", "transactions",
+     {"$or": [{"from_account_id": "sample", "created_at": {"$gte": datetime(2000, 1, 1)}},
+              {"to_account_id": "sample", "created_at": {"$gte": datetime(2000, 1, 1)}}]}, None),
+    ("account export", "transactions",
+     {"$or": [{"from_account_id": "sample"}, {"to_account_id": "sample"}]}, [("created_at", 1), ("transaction_id", 1)]),
+    ("ledger rows by idempotency key", "transactions", {"idempotency_key": "sample"}, None),
+    ("admin transaction feed", "transactions", {}, [("created_at", -1), ("transaction_id", -1)]),
+    ("admin transaction feed by date", "transactions",
+     {"created_at": {"$gte": datetime(2000, 1, 1)}}, [("created_at", -1), ("transaction_id", -1)]),
+    ("admin transaction feed by type", "transactions",
+     {"transfer_type": "internal"}, [("created_at", -1), ("transaction_id", -1)]),
+    ("admin transaction export", "transactions",
+     {"created_at": {"$gte": datetime(2000, 1, 1)}}, [("created_at", 1), ("transaction_id", 1)]),
+    ("job by id", "jobs", {"job_id": "sample"}, None),
+    ("running month-end job", "jobs", {"type": "month_end", "period": "2000-01", "status": "running"}, None),
+    ("interrupted jobs", "jobs", {"status": "running", "lease_expires_at": {"$lt": datetime(2000, 1, 1)}}, None),
+    ("analytics daily rollups", "analytics_rollups", {"_id": {"$gte": "day:2000-01-01", "$lte": "day:2000-01-31"}}, None),
+]
+
+async def ensure_indexes():
+    """Create the declared indexes and return any that are still missing afterwards"""
+    missing = []
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        await collection.create_indexes(indexes)
+        existing = await collection.index_information()
+        for index in indexes:
+            name = index.document["name"]
+            if name not in existing or list(existing[name]["key"]) != list(index.document["key"].items()):
+                missing.append(f"{collection_name}.{name}")
+    return missing
+
+def plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() plan tree"""
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return [stage for stage in stages if stage]
+
+def plan_indexes(plan: dict) -> List[str]:
+    """Names of the indexes an explain() plan tree scans"""
+    indexes = [plan["indexName"]] if "indexName" in plan else []
+    if "inputStage" in plan:
+        indexes += plan_indexes(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        indexes += plan_indexes(child)
+    return indexes
+
+async def check_query_plans():
+    """Explain every entry in QUERY_SHAPES and report the winning plan stages"""
+    report = []
+    for name, collection_name, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query).limit(100)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        report.append({
+            "query": name,
+            "collection": collection_name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return report
+
 # API Routes
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    ping_ms = None
+    ping_error = None
+    try:
+        started = time.perf_counter()
+        await asyncio.wait_for(client.admin.command("ping"), HEALTH_PING_TIMEOUT_SECONDS)
+        ping_ms = round((time.perf_counter() - started) * 1000, 3)
+    except Exception as e:
+        ping_error = f"{type(e).__name__}: {e}"
+    
+    ready = readiness["state"] == "ready" and ping_error is None
+    pool = metrics.pool_stats()
+    body = {
+        "status": "healthy" if ready else readiness["state"] if ping_error is None else "unavailable",
+        "ready": ready,
+        "timestamp": datetime.utcnow(),
+        "warmup": readiness,
+        "mongo": {"ping_ms": ping_ms, "error": ping_error},
+        "pool": {
+            "max_size": MONGO_MAX_POOL_SIZE,
+            "min_size": MONGO_MIN_POOL_SIZE,
+            "servers": {
+                address: {**stats, "utilization": round(stats["in_use"] / MONGO_MAX_POOL_SIZE, 4)}
+                for address, stats in pool.items()
+            }
+        }
+    }
+    return ORJSONResponse(body, status_code=200 if ready else 503)
+
+# Liveness only: the process is up and serving, whatever the state of Mongo
+@app.get("/api/health/live")
+async def liveness_check():
+    return {"status": "alive", "timestamp": datetime.utcnow()}
 
 @app.post("/api/auth/register")
 async def register_user(user_data: UserRegistration):
     # Check if user already exists
-    existing_user = db.users.find_one({"email": user_data.email})
+    existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     
     user = {
         "user_id": user_id,
@@ -264,11 +2442,13 @@ async def register_user(user_data: UserRegistration):
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
+    user["search_terms"] = user_search_terms(user)
     
-    db.users.insert_one(user)
+    await db.users.insert_one(user)
+    await record_user_rollups(user)
     
     # Create default accounts
-    accounts = create_user_accounts(user_id)
+    accounts = await create_user_accounts(user)
     
     # Convert ObjectId to string for all accounts
     for account in accounts:
@@ -293,7 +2473,7 @@ async def register_user(user_data: UserRegistration):
 
 @app.post("/api/auth/login")
 async def login_user(login_data: UserLogin):
-    user = db.users.find_one({"email": login_data.email})
+    user = await db.users.find_one({"email": login_data.email})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -304,25 +2484,24 @@ async def login_user(login_data: UserLogin):
     if user.get("failed_login_attempts", 0) >= 5:
         raise HTTPException(status_code=401, detail="Account locked due to too many failed attempts")
     
-    if not verify_password(login_data.password, user["password"]):
+    valid, replacement_hash = await verify_password(login_data.password, user["password"])
+    if not valid:
         # Increment failed attempts
-        db.users.update_one(
+        await db.users.update_one(
             {"user_id": user["user_id"]},
             {"$inc": {"failed_login_attempts": 1}}
         )
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Reset failed attempts and update last login
-    db.users.update_one(
-        {"user_id": user["user_id"]},
-        {
-            "$set": {
-                "failed_login_attempts": 0,
-                "last_login": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    # Reset failed attempts and update last login, upgrading a legacy or weaker hash in the same write
+    updates = {
+        "failed_login_attempts": 0,
+        "last_login": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+    if replacement_hash:
+        updates["password"] = replacement_hash
+    await db.users.update_one({"user_id": user["user_id"]}, {"$set": updates})
     
     token = create_jwt_token(user)
     
@@ -339,17 +2518,12 @@ async def login_user(login_data: UserLogin):
     }
 
 @app.get("/api/accounts")
-async def get_user_accounts(current_user = Depends(get_current_user)):
-    accounts = list(db.accounts.find(
-        {"user_id": current_user["user_id"]}
-    ))
+async def get_user_accounts(current_user = Depends(get_current_user), fields: Optional[str] = Query(None)):
+    accounts = await db.accounts.find(
+        {"user_id": current_user["user_id"]}, {**(field_projection(fields, "accounts") or {}), "_id": 0}
+    ).to_list(length=None)
     
-    # Convert ObjectId to string to make it JSON serializable
-    for account in accounts:
-        if "_id" in account:
-            account["_id"] = str(account["_id"])
-    
-    return {"accounts": accounts}
+    return ORJSONResponse({"accounts": accounts})
 
 @app.get("/api/accounts/{account_id}/transactions")
 async def get_account_transactions(
@@ -358,36 +2532,40 @@ async def get_account_transactions(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     transaction_type: Optional[str] = Query(None),
-    limit: int = Query(50, le=100)
+    limit: int = Query(50, le=100),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None)
 ):
     # Verify account ownership or admin access
-    account = db.accounts.find_one({"account_id": account_id})
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    if current_user["role"] not in ["admin", "super_admin"] and account["user_id"] != current_user["user_id"]:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    # Build query filters
-    query = {"$or": [{"from_account_id": account_id}, {"to_account_id": account_id}]}
-    
-    if start_date:
-        query["created_at"] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        if "created_at" not in query:
-            query["created_at"] = {}
-        query["created_at"]["$lte"] = datetime.fromisoformat(end_date)
-    if transaction_type:
-        query["transfer_type"] = transaction_type
-    
-    transactions = list(db.transactions.find(query).sort("created_at", -1).limit(limit))
+    account = await authorize_account_access(account_id, current_user)
+    
+    # Build query filters, applied to both the outgoing and incoming branch
+    filters = transaction_filters(start_date, end_date, transaction_type)
+    query = keyset_query(
+        [{"from_account_id": account_id, **filters}, {"to_account_id": account_id, **filters}],
+        "transaction_id",
+        cursor
+    )
+    projection = field_projection(fields, "transactions", ("created_at", "transaction_id"))
+    transactions, next_cursor = await fetch_page(reporting_db.transactions, query, "transaction_id", limit, projection)
     
-    # Convert ObjectId to string to make it JSON serializable
-    for transaction in transactions:
-        if "_id" in transaction:
-            transaction["_id"] = str(transaction["_id"])
+    return ORJSONResponse({"transactions": transactions, "next_cursor": next_cursor})
+
+@app.get("/api/accounts/{account_id}/transactions/export")
+async def export_account_transactions(
+    account_id: str,
+    current_user = Depends(get_current_user),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    transaction_type: Optional[str] = Query(None),
+    export_format: str = Query("ndjson", alias="format")
+):
+    # Verify account ownership or admin access
+    account = await authorize_account_access(account_id, current_user)
     
-    return {"transactions": transactions}
+    filters = transaction_filters(start_date, end_date, transaction_type)
+    query = {"$or": [{"from_account_id": account_id, **filters}, {"to_account_id": account_id, **filters}]}
+    return export_response(query, export_format, f"transactions-{account['account_number']}")
 
 @app.get("/api/accounts/{account_id}/statement")
 async def get_account_statement(
@@ -397,38 +2575,42 @@ async def get_account_statement(
     year: int = Query(datetime.now().year)
 ):
     # Verify account ownership or admin access
-    account = db.accounts.find_one({"account_id": account_id})
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    if current_user["role"] not in ["admin", "super_admin"] and account["user_id"] != current_user["user_id"]:
-        raise HTTPException(status_code=403, detail="Access denied")
+    account = await authorize_account_access(account_id, current_user)
     
     # Get start and end dates for the month
     start_date = datetime(year, month, 1)
     if month == 12:
-        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
+        end_date = datetime(year + 1, 1, 1)
     else:
-        end_date = datetime(year, month + 1, 1) - timedelta(days=1)
+        end_date = datetime(year, month + 1, 1)
     
     # Get transactions for the month
-    transactions = list(db.transactions.find({
+    transactions = await reporting_db.transactions.find({
         "$or": [{"from_account_id": account_id}, {"to_account_id": account_id}],
-        "created_at": {"$gte": start_date, "$lte": end_date}
-    }).sort("created_at", 1))
-    
-    # Calculate statement data
-    opening_balance = account["balance"]
+        "created_at": {"$gte": start_date, "$lt": end_date}
+    }, {"_id": 0}).sort("created_at", 1).to_list(length=None)
+    
+    # Opening and closing balances come from the daily snapshots, or the ledger where there are none
+    opened_at = account.get("created_at") or start_date
+    opened = snapshot_day(opened_at)
+    if start_date <= opened_at < end_date:
+        # Opened during the period: start from the deposit it was opened with, which has no ledger row
+        opening_balance = await balance_from_ledger(account_id, opened_at, reporting_db)
+    else:
+        opening_balance = await balance_before(account_id, start_date, reporting_db)
+        if opening_balance is None and opened < start_date:
+            opening_balance = await balance_from_ledger(account_id, start_date, reporting_db)
+    if opening_balance is None:
+        opening_balance = 0.0  # Account did not exist yet
+    closing_balance = await balance_before(account_id, end_date, reporting_db)
+    if closing_balance is None and opened < end_date:
+        closing_balance = await balance_from_ledger(account_id, end_date, reporting_db)
+    if closing_balance is None:
+        closing_balance = opening_balance
     total_credits = sum(t["amount"] for t in transactions if t.get("to_account_id") == account_id)
     total_debits = sum(t["amount"] for t in transactions if t.get("from_account_id") == account_id)
-    closing_balance = opening_balance + total_credits - total_debits
     
-    # Serialize transactions
-    for transaction in transactions:
-        if "_id" in transaction:
-            transaction["_id"] = str(transaction["_id"])
-    
-    return {
+    return ORJSONResponse({
         "statement": {
             "account_id": account_id,
             "account_number": account["account_number"],
@@ -441,107 +2623,270 @@ async def get_account_statement(
             "transaction_count": len(transactions),
             "transactions": transactions
         }
-    }
+    })
 
-@app.post("/api/transfers")
-async def create_transfer(transfer_data: TransferRequest, current_user = Depends(get_current_user)):
-    # Verify source account ownership
-    from_account = db.accounts.find_one({"account_id": transfer_data.from_account_id})
-    if not from_account or from_account["user_id"] != current_user["user_id"]:
-        raise HTTPException(status_code=403, detail="Invalid source account")
-    
-    # Check account status
-    if from_account["status"] != "active":
-        raise HTTPException(status_code=400, detail="Source account is not active")
-    
-    # Check transfer limits
-    if transfer_data.amount > 10000:  # Demo limit
-        raise HTTPException(status_code=400, detail="Transfer amount exceeds daily limit")
-    
-    # Check sufficient balance
-    if from_account["balance"] < transfer_data.amount:
-        raise HTTPException(status_code=400, detail="Insufficient funds")
-    
-    # Handle different transfer types
+TRANSFER_TYPES = ["internal", "wire", "domestic"]
+TRANSFER_LIMIT = 10000  # Demo limit
+
+def transfer_transaction(transfer_data: TransferRequest, user_id: str) -> dict:
+    """Build the ledger row for a transfer (not yet inserted)"""
     if transfer_data.transfer_type == "internal":
         # Internal transfer between user's own accounts
-        to_account = db.accounts.find_one({"account_id": transfer_data.to_account_id})
-        if not to_account or to_account["user_id"] != current_user["user_id"]:
-            raise HTTPException(status_code=400, detail="Invalid destination account")
-        
-        if to_account["status"] != "active":
-            raise HTTPException(status_code=400, detail="Destination account is not active")
-        
-        # Update balances
-        db.accounts.update_one(
-            {"account_id": transfer_data.from_account_id},
-            {"$inc": {"balance": -transfer_data.amount}, "$set": {"updated_at": datetime.utcnow()}}
-        )
-        db.accounts.update_one(
-            {"account_id": transfer_data.to_account_id},
-            {"$inc": {"balance": transfer_data.amount}, "$set": {"updated_at": datetime.utcnow()}}
-        )
-        
-        # Create transaction record
-        transaction = create_transaction({
+        return new_transaction({
             "from_account_id": transfer_data.from_account_id,
             "to_account_id": transfer_data.to_account_id,
             "amount": transfer_data.amount,
             "transfer_type": transfer_data.transfer_type,
             "description": transfer_data.description,
             "status": "completed",
-            "user_id": current_user["user_id"],
+            "user_id": user_id,
             "confirmation_number": str(uuid.uuid4())[:8].upper()
         })
+    # External transfer (simulated)
+    return new_transaction({
+        "from_account_id": transfer_data.from_account_id,
+        "to_account_id": None,
+        "amount": transfer_data.amount,
+        "transfer_type": transfer_data.transfer_type,
+        "description": transfer_data.description,
+        "recipient_name": transfer_data.recipient_name,
+        "recipient_bank": transfer_data.recipient_bank,
+        "routing_number": transfer_data.routing_number,
+        "status": "pending" if transfer_data.transfer_type == "wire" else "completed",
+        "user_id": user_id,
+        "confirmation_number": str(uuid.uuid4())[:8].upper(),
+        "estimated_arrival": datetime.utcnow() + timedelta(days=1 if transfer_data.transfer_type == "domestic" else 3)
+    })
+
+async def transfer_rejection(account_id: str, user_id: str) -> HTTPException:
+    """Explain why a guarded debit matched no account (only read on the failure path)"""
+    account = await db.accounts.find_one({"account_id": account_id}, {"user_id": 1, "status": 1})
+    if not account or account["user_id"] != user_id:
+        return HTTPException(status_code=403, detail="Invalid source account")
+    if account["status"] != "active":
+        return HTTPException(status_code=400, detail="Source account is not active")
+    return HTTPException(status_code=400, detail="Insufficient funds")
+
+async def process_transfer(transfer_data: TransferRequest, current_user: dict):
+    if transfer_data.transfer_type not in TRANSFER_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid transfer type")
+    
+    # Check transfer limits; NaN fails every comparison, so test it explicitly
+    if not math.isfinite(transfer_data.amount) or transfer_data.amount <= 0:
+        raise HTTPException(status_code=400, detail="Invalid transfer amount")
+    if transfer_data.amount > TRANSFER_LIMIT:
+        raise HTTPException(status_code=400, detail="Transfer amount exceeds daily limit")
+    
+    if transfer_data.transfer_type == "internal":
+        to_account = await get_account_summary(transfer_data.to_account_id) if transfer_data.to_account_id else None
+        if not to_account or to_account["user_id"] != current_user["user_id"]:
+            raise HTTPException(status_code=400, detail="Invalid destination account")
+    
+    transaction = tag_idempotent([transfer_transaction(transfer_data, current_user["user_id"])])[0]
+    transaction["_id"] = ObjectId()
+    response = {
+        "message": "Transfer initiated successfully",
+        "transaction": {**transaction, "_id": str(transaction["_id"])},
+        "confirmation_number": transaction["confirmation_number"]
+    }
     
-    elif transfer_data.transfer_type in ["wire", "domestic"]:
-        # External transfer (simulated)
-        # Update source account balance
-        db.accounts.update_one(
-            {"account_id": transfer_data.from_account_id},
-            {"$inc": {"balance": -transfer_data.amount}, "$set": {"updated_at": datetime.utcnow()}}
+    async def apply_transfer(session):
+        # Ownership, status and sufficient funds are checked by the debit itself
+        from_account = await update_balance(
+            transfer_data.from_account_id,
+            -transfer_data.amount,
+            {"user_id": current_user["user_id"], "status": "active", "balance": {"$gte": transfer_data.amount}},
+            session
         )
+        if not from_account:
+            raise await transfer_rejection(transfer_data.from_account_id, current_user["user_id"])
+        changes = [(from_account, -transfer_data.amount)]
         
-        # Create transaction record
-        transaction = create_transaction({
-            "from_account_id": transfer_data.from_account_id,
-            "to_account_id": None,
-            "amount": transfer_data.amount,
-            "transfer_type": transfer_data.transfer_type,
-            "description": transfer_data.description,
-            "recipient_name": transfer_data.recipient_name,
-            "recipient_bank": transfer_data.recipient_bank,
-            "routing_number": transfer_data.routing_number,
-            "status": "pending" if transfer_data.transfer_type == "wire" else "completed",
-            "user_id": current_user["user_id"],
-            "confirmation_number": str(uuid.uuid4())[:8].upper(),
-            "estimated_arrival": datetime.utcnow() + timedelta(days=1 if transfer_data.transfer_type == "domestic" else 3)
-        })
+        if transfer_data.transfer_type == "internal":
+            to_account = await update_balance(
+                transfer_data.to_account_id,
+                transfer_data.amount,
+                {"user_id": current_user["user_id"], "status": "active"},
+                session
+            )
+            if not to_account:
+                if session is None:
+                    # No transaction to abort: put the debited amount back
+                    await update_balance(transfer_data.from_account_id, transfer_data.amount)
+                raise HTTPException(status_code=400, detail="Destination account is not active")
+            changes.append((to_account, transfer_data.amount))
+        
+        await stage_idempotent_response(response, session)
+        await db.transactions.insert_one(transaction, session=session)
+        return changes
     
-    # Convert ObjectId to string
-    if "_id" in transaction:
-        transaction["_id"] = str(transaction["_id"])
+    changes = await run_in_transaction(apply_transfer)
+    await record_balance_changes(changes, [transaction])
+    return response
+
+@app.post("/api/transfers")
+async def create_transfer(
+    transfer_data: TransferRequest,
+    current_user = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await run_idempotent(
+        idempotency_key, current_user, "transfers", transfer_data,
+        lambda: process_transfer(transfer_data, current_user)
+    )
+
+async def process_batch_transfer(batch_data: BatchTransferRequest, current_user: dict):
+    """Fan out many transfers from one source account with one debit and bulk writes"""
+    transfers = batch_data.transfers
+    if not transfers:
+        raise HTTPException(status_code=400, detail="Batch contains no transfers")
+    if len(transfers) > TRANSFER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {TRANSFER_BATCH_MAX} transfers")
+    from_account_id = transfers[0].from_account_id
+    if any(t.from_account_id != from_account_id for t in transfers):
+        raise HTTPException(status_code=400, detail="All transfers in a batch must share one source account")
+    
+    # One lookup for every internal destination
+    destination_ids = list({t.to_account_id for t in transfers if t.transfer_type == "internal" and t.to_account_id})
+    destinations = {
+        account["account_id"]: account
+        for account in await db.accounts.find(
+            {"account_id": {"$in": destination_ids}}, {"account_id": 1, "user_id": 1, "status": 1}
+        ).to_list(length=None)
+    } if destination_ids else {}
+    
+    results = []
+    transactions = []
+    credits = {}
+    for index, transfer_data in enumerate(transfers):
+        error = None
+        if transfer_data.transfer_type not in TRANSFER_TYPES:
+            error = "Invalid transfer type"
+        elif not math.isfinite(transfer_data.amount) or transfer_data.amount <= 0:
+            error = "Invalid transfer amount"
+        elif transfer_data.amount > TRANSFER_LIMIT:
+            error = "Transfer amount exceeds daily limit"
+        elif transfer_data.transfer_type == "internal":
+            to_account = destinations.get(transfer_data.to_account_id)
+            if not to_account or to_account["user_id"] != current_user["user_id"]:
+                error = "Invalid destination account"
+            elif to_account["status"] != "active":
+                error = "Destination account is not active"
+            elif transfer_data.to_account_id == from_account_id:
+                error = "Destination account must differ from source account"
+        if error:
+            results.append({"index": index, "status": "rejected", "detail": error})
+            continue
+        transaction = tag_idempotent([transfer_transaction(transfer_data, current_user["user_id"])])[0]
+        transactions.append(transaction)
+        if transfer_data.transfer_type == "internal":
+            credits[transfer_data.to_account_id] = credits.get(transfer_data.to_account_id, 0) + transfer_data.amount
+        results.append({
+            "index": index,
+            "status": transaction["status"],
+            "transaction_id": transaction["transaction_id"],
+            "confirmation_number": transaction["confirmation_number"]
+        })
     
-    return {
-        "message": "Transfer initiated successfully",
-        "transaction": transaction,
-        "confirmation_number": transaction["confirmation_number"]
+    total_amount = sum(t["amount"] for t in transactions)
+    response = {
+        "message": "Batch transfer processed",
+        "from_account_id": from_account_id,
+        "total_amount": total_amount,
+        "accepted": len(transactions),
+        "rejected": len(transfers) - len(transactions),
+        "results": results
     }
+    if transactions:
+        async def apply_batch(session):
+            # One aggregate balance check: the source must cover every accepted item
+            from_account = await update_balance(
+                from_account_id,
+                -total_amount,
+                {"user_id": current_user["user_id"], "status": "active", "balance": {"$gte": total_amount}},
+                session
+            )
+            if not from_account:
+                raise await transfer_rejection(from_account_id, current_user["user_id"])
+            if credits:
+                # Guarded like the single transfer's credit, in case a destination closed since it was read
+                credit_filter = {"user_id": current_user["user_id"], "status": "active"}
+                result = await db.accounts.bulk_write([
+                    UpdateOne(
+                        {"account_id": account_id, **credit_filter},
+                        {"$inc": {"balance": amount, "balance_version": 1}, "$set": {"updated_at": datetime.utcnow()}}
+                    )
+                    for account_id, amount in credits.items()
+                ], ordered=False, session=session)
+                if result.matched_count != len(credits):
+                    if session is None:
+                        # No transaction to abort: take back the credits that landed and refund the source
+                        await db.accounts.bulk_write([
+                            UpdateOne(
+                                {"account_id": account_id, **credit_filter},
+                                {"$inc": {"balance": -amount, "balance_version": 1},
+                                 "$set": {"updated_at": datetime.utcnow()}}
+                            )
+                            for account_id, amount in credits.items()
+                        ], ordered=False)
+                        await update_balance(from_account_id, total_amount)
+                    raise HTTPException(status_code=400, detail="Destination account is not active")
+            await stage_idempotent_response(response, session)
+            await db.transactions.insert_many(transactions, ordered=False, session=session)
+            return from_account
+        
+        from_account = await run_in_transaction(apply_batch)
+        credited = await db.accounts.find(
+            {"account_id": {"$in": list(credits)}}, {"account_id": 1, "balance": 1, "balance_version": 1}
+        ).to_list(length=None) if credits else []
+        await record_balance_changes(
+            [(from_account, -total_amount)] + [(account, credits[account["account_id"]]) for account in credited],
+            transactions
+        )
+    
+    return response
+
+@app.post("/api/transfers/batch")
+async def create_batch_transfer(
+    batch_data: BatchTransferRequest,
+    current_user = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await run_idempotent(
+        idempotency_key, current_user, "transfers/batch", batch_data,
+        lambda: process_batch_transfer(batch_data, current_user)
+    )
+
+@app.get("/api/metrics")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Admin routes
 @app.get("/api/admin/users")
-async def get_all_users(current_user = Depends(get_current_user)):
+async def get_all_users(
+    current_user = Depends(get_current_user),
+    limit: int = Query(100, le=500),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, max_length=100),
+    user_status: Optional[str] = Query(None, alias="status"),
+    role: Optional[str] = Query(None)
+):
     if current_user["role"] not in ["admin", "super_admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    users = list(db.users.find({}, {"password": 0}))
-    
-    # Convert ObjectId to string to make it JSON serializable
-    for user in users:
-        if "_id" in user:
-            user["_id"] = str(user["_id"])
+    # Prefix search over email, name and phone plus status/role filters, newest first
+    filters = user_directory_filter(q, user_status, role)
+    query = keyset_query([filters], "user_id", cursor)
+    projection = field_projection(fields, "users", ("created_at", "user_id")) or {"password": 0, "search_terms": 0}
+    users, next_cursor = await fetch_page(reporting_db.users, query, "user_id", limit, projection)
     
-    return {"users": users}
+    # The total only needs computing for the first page
+    counts = await count_matching(reporting_db.users, filters) if not cursor else {}
+    return ORJSONResponse({"users": users, "next_cursor": next_cursor, **counts})
 
 @app.post("/api/admin/users/status")
 async def update_user_status(status_data: UserStatusUpdate, current_user = Depends(get_current_user)):
@@ -552,178 +2897,249 @@ async def update_user_status(status_data: UserStatusUpdate, current_user = Depen
     if status_data.user_id == current_user["user_id"]:
         raise HTTPException(status_code=400, detail="Cannot modify your own account status")
     
-    user = db.users.find_one({"user_id": status_data.user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Update user status
-    db.users.update_one(
+    # Update user status, keeping the previous document to adjust the active-user counter
+    user = await db.users.find_one_and_update(
         {"user_id": status_data.user_id},
         {"$set": {"status": status_data.status, "updated_at": datetime.utcnow()}}
     )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    if (user["status"] == "active") != (status_data.status == "active"):
+        await record_rollups({"users_active": 1 if status_data.status == "active" else -1})
     
     # Also update account statuses
-    db.accounts.update_many(
+    await db.accounts.update_many(
         {"user_id": status_data.user_id},
         {"$set": {"status": status_data.status, "updated_at": datetime.utcnow()}}
     )
+    invalidate_user(status_data.user_id)
     
     return {"message": f"User status updated to {status_data.status}"}
 
 @app.get("/api/admin/accounts")
-async def get_all_accounts(current_user = Depends(get_current_user)):
+async def get_all_accounts(
+    current_user = Depends(get_current_user),
+    limit: int = Query(100, le=500),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+    account_type: Optional[str] = Query(None),
+    account_status: Optional[str] = Query(None, alias="status"),
+    min_balance: Optional[float] = Query(None),
+    max_balance: Optional[float] = Query(None),
+    owner_email: Optional[str] = Query(None)
+):
     if current_user["role"] not in ["admin", "super_admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    pipeline = [
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "user_id",
-                "foreignField": "user_id",
-                "as": "user_info"
-            }
-        },
-        {
-            "$unwind": "$user_info"
-        },
-        {
-            "$project": {
-                "account_id": 1,
-                "account_number": 1,
-                "account_type": 1,
-                "balance": 1,
-                "status": 1,
-                "interest_rate": 1,
-                "monthly_fee": 1,
-                "user_name": {"$concat": ["$user_info.first_name", " ", "$user_info.last_name"]},
-                "user_email": "$user_info.email",
-                "created_at": 1
-            }
-        }
-    ]
-    
-    accounts = list(db.accounts.aggregate(pipeline))
-    
-    # Convert ObjectId to string to make it JSON serializable
-    for account in accounts:
-        if "_id" in account:
-            account["_id"] = str(account["_id"])
+    # Owner name/email are stored on the account, so filtering and paging need no join
+    filters = {}
+    if account_type:
+        filters["account_type"] = account_type
+    if account_status:
+        filters["status"] = account_status
+    if min_balance is not None or max_balance is not None:
+        filters["balance"] = {}
+        if min_balance is not None:
+            filters["balance"]["$gte"] = min_balance
+        if max_balance is not None:
+            filters["balance"]["$lte"] = max_balance
+    if owner_email:
+        filters["user_email"] = owner_email
+    
+    query = keyset_query([filters], "account_id", cursor)
+    projection = field_projection(fields, "admin_accounts", ("created_at", "account_id")) or {
+        field: 1 for field in FIELD_ALLOW_LISTS["admin_accounts"]
+    }
+    accounts, next_cursor = await fetch_page(reporting_db.accounts, query, "account_id", limit, projection)
     
-    return {"accounts": accounts}
+    counts = await count_matching(reporting_db.accounts, filters) if not cursor else {}
+    return ORJSONResponse({"accounts": accounts, "next_cursor": next_cursor, **counts})
 
-@app.post("/api/admin/credit-debit")
-async def admin_credit_debit(transaction_data: AdminCreditDebit, current_user = Depends(get_current_user)):
+async def process_credit_debit(transaction_data: AdminCreditDebit, current_user: dict):
     if current_user["role"] not in ["admin", "super_admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    account = db.accounts.find_one({"account_id": transaction_data.account_id})
+    amount_error = credit_debit_amount_error(transaction_data.amount)
+    if amount_error:
+        raise HTTPException(status_code=400, detail=amount_error)
+    
+    account = await db.accounts.find_one({"account_id": transaction_data.account_id})
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
     # Handle credit/debit
     amount_change = transaction_data.amount if transaction_data.transaction_type == "credit" else -transaction_data.amount
     
-    # Check for sufficient funds in case of debit
-    if transaction_data.transaction_type == "debit" and account["balance"] < transaction_data.amount:
-        raise HTTPException(status_code=400, detail="Insufficient funds for debit")
-    
-    # Update account balance
-    db.accounts.update_one(
-        {"account_id": transaction_data.account_id},
-        {"$inc": {"balance": amount_change}, "$set": {"updated_at": datetime.utcnow()}}
-    )
-    
     # Create transaction record with optional backdating
-    transaction_date = datetime.utcnow()
-    if transaction_data.backdate and current_user["role"] == "super_admin":
-        try:
-            transaction_date = datetime.fromisoformat(transaction_data.backdate)
-        except ValueError:
-            pass  # Use current date if invalid backdate
-    
-    transaction = {
-        "transaction_id": str(uuid.uuid4()),
-        "from_account_id": None if transaction_data.transaction_type == "credit" else transaction_data.account_id,
-        "to_account_id": transaction_data.account_id if transaction_data.transaction_type == "credit" else None,
-        "amount": transaction_data.amount,
-        "transfer_type": "admin_" + transaction_data.transaction_type,
-        "description": transaction_data.description,
-        "status": "completed",
-        "admin_user_id": current_user["user_id"],
-        "confirmation_number": str(uuid.uuid4())[:8].upper(),
-        "created_at": transaction_date,
-        "updated_at": datetime.utcnow(),
-        "backdated": transaction_data.backdate is not None
-    }
-    
-    result = db.transactions.insert_one(transaction)
-    transaction["_id"] = str(result.inserted_id)
-    
-    return {
+    transaction = tag_idempotent([admin_transaction(transaction_data, current_user)])[0]
+    transaction["_id"] = ObjectId()
+    response = {
         "message": f"Account {transaction_data.transaction_type} successful",
-        "transaction": transaction,
+        "transaction": {**transaction, "_id": str(transaction["_id"])},
         "confirmation_number": transaction["confirmation_number"]
     }
+    
+    async def apply_credit_debit(session):
+        # A debit checks for sufficient funds in the update itself
+        conditions = {"balance": {"$gte": transaction_data.amount}} if transaction_data.transaction_type == "debit" else {}
+        account = await update_balance(transaction_data.account_id, amount_change, conditions, session)
+        if not account:
+            raise HTTPException(status_code=400, detail="Insufficient funds for debit")
+        await stage_idempotent_response(response, session)
+        await db.transactions.insert_one(transaction, session=session)
+        return account
+    
+    account = await run_in_transaction(apply_credit_debit)
+    await record_balance_changes([(account, amount_change)], [transaction])
+    await rebuild_backdated_snapshots([transaction])
+    return response
+
+@app.post("/api/admin/credit-debit")
+async def admin_credit_debit(
+    transaction_data: AdminCreditDebit,
+    current_user = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await run_idempotent(
+        idempotency_key, current_user, "admin/credit-debit", transaction_data,
+        lambda: process_credit_debit(transaction_data, current_user)
+    )
+
+@app.post("/api/admin/credit-debit/import")
+async def admin_credit_debit_import(file: UploadFile = File(...), current_user = Depends(get_current_user)):
+    """Apply a CSV of account_id,amount,type,description,backdate rows; returns a line-numbered error report"""
+    if current_user["role"] not in ["admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return await import_credit_debit_csv(file, current_user)
 
 @app.get("/api/admin/transactions")
 async def get_all_transactions(
     current_user = Depends(get_current_user),
     limit: int = Query(100, le=500),
     start_date: Optional[str] = Query(None),
-    end_date: Optional[str] = Query(None)
+    end_date: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None)
 ):
     if current_user["role"] not in ["admin", "super_admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Build query
-    query = {}
-    if start_date:
-        query["created_at"] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        if "created_at" not in query:
-            query["created_at"] = {}
-        query["created_at"]["$lte"] = datetime.fromisoformat(end_date)
+    query = keyset_query([transaction_filters(start_date, end_date)], "transaction_id", cursor)
+    projection = field_projection(fields, "transactions", ("created_at", "transaction_id"))
+    transactions, next_cursor = await fetch_page(reporting_db.transactions, query, "transaction_id", limit, projection)
     
-    transactions = list(db.transactions.find(query).sort("created_at", -1).limit(limit))
+    return ORJSONResponse({"transactions": transactions, "next_cursor": next_cursor})
+
+@app.get("/api/admin/transactions/export")
+async def export_all_transactions(
+    current_user = Depends(get_current_user),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    transaction_type: Optional[str] = Query(None),
+    export_format: str = Query("ndjson", alias="format")
+):
+    if current_user["role"] not in ["admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Convert ObjectId to string to make it JSON serializable
-    for transaction in transactions:
-        if "_id" in transaction:
-            transaction["_id"] = str(transaction["_id"])
+    query = transaction_filters(start_date, end_date, transaction_type)
+    return export_response(query, export_format, "transactions")
+
+@app.get("/api/admin/cache-stats")
+async def get_cache_stats(current_user = Depends(get_current_user)):
+    if current_user["role"] not in ["admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    return {"transactions": transactions}
+    return {
+        "worker": os.getpid(),
+        "caches": {
+            "principals": principal_cache.stats(),
+            "accounts": account_cache.stats(),
+            "idempotency": idempotency_cache.stats()
+        },
+        "invalidation_bus": invalidation_bus.stats(),
+        "password_hashing": password_hasher.stats()
+    }
 
-@app.get("/api/admin/analytics")
-async def get_admin_analytics(current_user = Depends(get_current_user)):
+@app.get("/api/admin/slow-queries")
+async def get_slow_queries(
+    current_user = Depends(get_current_user),
+    limit: int = Query(100, ge=1, le=SLOW_QUERY_LOG_SIZE or 1)
+):
     if current_user["role"] not in ["admin", "super_admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Get user statistics
-    total_users = db.users.count_documents({})
-    active_users = db.users.count_documents({"status": "active"})
-    new_users_this_month = db.users.count_documents({
-        "created_at": {"$gte": datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)}
+    return ORJSONResponse({
+        "worker": os.getpid(),
+        "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "enabled": SLOW_QUERY_THRESHOLD_MS >= 0,
+        "queries": slow_queries.snapshot(limit)
     })
+
+@app.delete("/api/admin/slow-queries")
+async def clear_slow_queries(current_user = Depends(get_current_user)):
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Super admin access required")
+    
+    slow_queries.clear()
+    return {"message": "Slow query log cleared"}
+
+@app.get("/api/admin/profiles")
+async def get_profiles(current_user = Depends(get_current_user)):
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Super admin access required")
     
-    # Get account statistics
-    total_accounts = db.accounts.count_documents({})
-    total_balance = list(db.accounts.aggregate([
-        {"$group": {"_id": None, "total": {"$sum": "$balance"}}}
-    ]))
-    total_balance = total_balance[0]["total"] if total_balance else 0
-    
-    # Get transaction statistics
-    total_transactions = db.transactions.count_documents({})
-    transactions_today = db.transactions.count_documents({
-        "created_at": {"$gte": datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)}
+    return ORJSONResponse({
+        "worker": os.getpid(),
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "profiles": [
+            {key: value for key, value in result.items() if key != "stacks"}
+            for result in reversed(profiler.profiles)
+        ]
     })
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    current_user = Depends(get_current_user),
+    profile_format: str = Query("json", alias="format", pattern="^(json|collapsed)$")
+):
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Super admin access required")
+    
+    result = profiler.get(profile_id)
+    if not result:
+        # Profiles stay in the worker that served the request (its pid is in X-Profile-Worker)
+        raise HTTPException(status_code=404, detail=f"Profile not found on worker {os.getpid()}")
+    
+    if profile_format == "collapsed":
+        # Brendan Gregg's folded format weighted in microseconds, readable by flamegraph.pl and speedscope
+        return PlainTextResponse("".join(f"{stack} {count}\n" for stack, count in result["stacks"].items()))
+    return ORJSONResponse(result)
+
+@app.get("/api/admin/analytics")
+async def get_admin_analytics(current_user = Depends(get_current_user)):
+    if current_user["role"] not in ["admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Get transaction volume
-    transaction_volume = list(db.transactions.aggregate([
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]))
-    transaction_volume = transaction_volume[0]["total"] if transaction_volume else 0
+    # Read the global counters and this month's daily counters
+    totals = await reporting_db.analytics_rollups.find_one({"_id": "global"}) or {}
+    today = snapshot_day(datetime.utcnow())
+    days = await reporting_db.analytics_rollups.find({
+        "_id": {"$gte": rollup_day_id(today.replace(day=1)), "$lte": rollup_day_id(today)}
+    }).to_list(length=None)
+    
+    total_users = totals.get("users_total", 0)
+    active_users = totals.get("users_active", 0)
+    new_users_this_month = sum(day.get("users_new", 0) for day in days)
+    
+    total_accounts = totals.get("accounts_total", 0)
+    total_balance = totals.get("total_balance", 0)
+    
+    total_transactions = totals.get("transactions_total", 0)
+    transactions_today = sum(day.get("transactions", 0) for day in days if day["_id"] == rollup_day_id(today))
+    transaction_volume = totals.get("transaction_volume", 0)
     
     return {
         "analytics": {
@@ -744,45 +3160,110 @@ async def get_admin_analytics(current_user = Depends(get_current_user)):
         }
     }
 
-@app.post("/api/admin/bulk-operations")
-async def bulk_operations(current_user = Depends(get_current_user)):
+@app.post("/api/admin/bulk-operations", status_code=202)
+async def bulk_operations(
+    current_user = Depends(get_current_user),
+    period: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    batch_size: int = Query(BULK_OPERATIONS_BATCH_SIZE, ge=1, le=10000)
+):
     if current_user["role"] != "super_admin":
         raise HTTPException(status_code=403, detail="Super admin access required")
     
-    # Apply monthly interest to all savings accounts
-    savings_accounts = list(db.accounts.find({"account_type": "savings", "status": "active"}))
-    interest_applied = 0
-    
-    for account in savings_accounts:
-        apply_monthly_interest(account["account_id"])
-        interest_applied += 1
+    period = period or datetime.utcnow().strftime("%Y-%m")
+    period_error = month_end_period_error(period)
+    if period_error:
+        raise HTTPException(status_code=400, detail=period_error)
     
-    # Apply monthly fees to all checking accounts
-    checking_accounts = list(db.accounts.find({"account_type": "checking", "status": "active"}))
-    fees_applied = 0
-    
-    for account in checking_accounts:
-        apply_monthly_fees(account["account_id"])
-        fees_applied += 1
+    # Apply monthly interest to savings accounts and monthly fees to checking accounts in the background
+    job = await start_month_end_job(period, batch_size, current_user["user_id"])
+    job["_id"] = str(job["_id"])
     
     return {
-        "message": "Bulk operations completed",
-        "interest_applied": interest_applied,
-        "fees_applied": fees_applied
+        "message": "Bulk operations started",
+        "job": job
     }
 
-# Create admin user on startup
-@app.on_event("startup")
+@app.get("/api/admin/jobs/{job_id}")
+async def get_job(job_id: str, current_user = Depends(get_current_user)):
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Super admin access required")
+    
+    job = await db.jobs.find_one({"job_id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    job["_id"] = str(job["_id"])
+    return {"job": job}
+
+@app.post("/api/admin/jobs/{job_id}/resume")
+async def resume_job(job_id: str, current_user = Depends(get_current_user)):
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Super admin access required")
+    
+    job = await db.jobs.find_one({"job_id": job_id}, {"period": 1})
+    period_error = month_end_period_error(job["period"]) if job else None
+    if period_error:
+        raise HTTPException(status_code=409, detail=period_error)
+    
+    job = await claim_job(job_id, ["running", "failed"])
+    if not job:
+        raise HTTPException(status_code=409, detail="Job is not resumable or is still running")
+    
+    schedule_job(job_id)
+    job["_id"] = str(job["_id"])
+    return {"message": "Job resumed", "job": job}
+
+# Create and verify indexes during warm-up
+async def create_indexes():
+    missing = await ensure_indexes()
+    if missing:
+        print(f"Warning: indexes not present after bootstrap: {', '.join(missing)}")
+
+# Build the analytics rollups on first start against an existing database
+async def bootstrap_rollups():
+    if not await db.analytics_rollups.find_one({"_id": "global", "built_at": {"$exists": True}}):
+        await rebuild_rollups()
+        print("Built analytics rollups from existing data")
+
+# Resume month-end jobs whose runner died
+async def resume_interrupted_jobs():
+    stale = await db.jobs.find(
+        {"status": "running", "lease_expires_at": {"$lt": datetime.utcnow()}}, {"job_id": 1}
+    ).to_list(length=None)
+    for job in stale:
+        if await claim_job(job["job_id"], ["running"]):
+            print(f"Resuming interrupted job {job['job_id']}")
+            schedule_job(job["job_id"])
+
+# Index users created before the directory search existed, in the background
+async def bootstrap_user_search_terms():
+    if await db.users.find_one({"search_terms": {"$exists": False}}, {"_id": 1}):
+        async def backfill():
+            print(f"Added search terms to {await backfill_user_search_terms()} users")
+        task = asyncio.create_task(backfill())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+# Denormalize owners onto accounts created before they were stored there, in the background
+async def bootstrap_account_owners():
+    if await db.accounts.find_one({"user_email": {"$exists": False}}, {"_id": 1}):
+        async def backfill():
+            print(f"Denormalized owners onto {await backfill_account_owners()} accounts")
+        task = asyncio.create_task(backfill())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+# Create the admin user on first start
 async def create_admin_user():
     admin_email = "admin@demobank.com"
-    admin_user = db.users.find_one({"email": admin_email})
+    admin_user = await db.users.find_one({"email": admin_email})
     
     if not admin_user:
         admin_id = str(uuid.uuid4())
         admin = {
             "user_id": admin_id,
             "email": admin_email,
-            "password": hash_password("admin123"),
+            "password": await hash_password("admin123"),
             "first_name": "Bank",
             "last_name": "Administrator",
             "phone": "555-0001",
@@ -795,9 +3276,209 @@ async def create_admin_user():
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
-        db.users.insert_one(admin)
+        admin["search_terms"] = user_search_terms(admin)
+        await db.users.insert_one(admin)
+        await record_user_rollups(admin)
         print(f"Created admin user: {admin_email} / admin123")
 
+# Touch the indexes behind every API query shape so their pages are in the server's cache
+async def prime_query_shapes():
+    for name, collection_name, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query, {"_id": 1}).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        await cursor.to_list(length=1)
+
+# Load the most recently active users and their accounts into the in-process caches
+async def prime_caches():
+    users = await db.users.find(
+        {"last_login": {"$ne": None}}, {"password": 0, "search_terms": 0}
+    ).sort("last_login", -1).limit(CACHE_WARMUP_USERS).to_list(length=CACHE_WARMUP_USERS)
+    for user in users:
+        principal_cache.set(user["user_id"], user)
+    user_ids = [user["user_id"] for user in users]
+    async for account in db.accounts.find({"user_id": {"$in": user_ids}}, ACCOUNT_CACHE_PROJECTION):
+        account_cache.set(account["account_id"], account)
+    return len(users)
+
+# Startup and readiness
+WARMUP_STEPS = [
+    create_indexes,
+    bootstrap_rollups,
+    resume_interrupted_jobs,
+    bootstrap_user_search_terms,
+    bootstrap_account_owners,
+    create_admin_user,
+    prime_query_shapes,
+    prime_caches
+]
+readiness = {"state": "starting", "error": None, "started_at": None, "ready_at": None, "warmup_seconds": None}
+
+async def open_connections(count: int):
+    """Run `count` concurrent pings so the pool opens that many connections up front"""
+    await asyncio.gather(*[client.admin.command("ping") for _ in range(count)])
+
+async def warm_up():
+    started = time.perf_counter()
+    while True:
+        try:
+            await open_connections(max(MONGO_WARMUP_CONNECTIONS, 1))
+            for step in WARMUP_STEPS:
+                await step()
+            break
+        except Exception as e:
+            readiness["error"] = f"{type(e).__name__}: {e}"
+            print(f"Warm-up failed, retrying in {MONGO_WARMUP_RETRY_SECONDS}s: {readiness['error']}")
+            await asyncio.sleep(MONGO_WARMUP_RETRY_SECONDS)
+    readiness.update({
+        "state": "ready",
+        "error": None,
+        "ready_at": datetime.utcnow(),
+        "warmup_seconds": round(time.perf_counter() - started, 3)
+    })
+    print(f"Warm-up finished in {readiness['warmup_seconds']}s")
+
+async def start_database():
+    connect_database()
+    # The slow query log schedules explain() calls on the server's event loop
+    slow_queries.loop = asyncio.get_running_loop()
+    readiness.update({"state": "starting", "error": None, "started_at": datetime.utcnow(), "ready_at": None})
+    for coroutine in (warm_up(), invalidation_bus.run()):
+        task = asyncio.create_task(coroutine)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+async def stop_database():
+    readiness["state"] = "stopping"
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    close_database()
+
+async def run_check_invalidation_bus() -> int:
+    """Change a throwaway user and account and time how long their invalidations take to arrive"""
+    if not await transactions_supported():
+        print("Change streams need a replica set, e.g. mongod --replSet rs0 followed by rs.initiate()")
+        return 1
+    received = asyncio.Queue()
+    invalidation_bus.subscribe("user", lambda user_id: received.put_nowait(("user", user_id)))
+    invalidation_bus.subscribe("account_status", lambda account_id: received.put_nowait(("account_status", account_id)))
+    bus = asyncio.create_task(invalidation_bus.run())
+    check_id = f"bus-check-{uuid.uuid4()}"
+    failures = 0
+    try:
+        deadline = time.monotonic() + 10
+        while invalidation_bus.state != "running":
+            if time.monotonic() > deadline:
+                print(f"Change stream did not open within 10s (bus is {invalidation_bus.state})")
+                return 1
+            await asyncio.sleep(0.05)
+        await db.users.insert_one({"user_id": check_id, "status": "active"})
+        await db.accounts.insert_one({"account_id": check_id, "user_id": check_id, "status": "active"})
+        for kind, collection, field in [("user", db.users, "user_id"), ("account_status", db.accounts, "account_id")]:
+            started = time.perf_counter()
+            await collection.update_one({field: check_id}, {"$set": {"status": "suspended"}})
+            try:
+                while await asyncio.wait_for(received.get(), 10) != (kind, check_id):
+                    pass
+                print(f"ok        {kind:<15} invalidation received in {(time.perf_counter() - started) * 1000:.1f}ms")
+            except asyncio.TimeoutError:
+                print(f"MISSING   {kind:<15} no invalidation within 10s")
+                failures += 1
+    finally:
+        await db.users.delete_one({"user_id": check_id})
+        await db.accounts.delete_one({"account_id": check_id})
+        bus.cancel()
+    return 1 if failures else 0
+
+async def run_check_query_plans() -> int:
+    await ensure_indexes()
+    report = await check_query_plans()
+    for entry in report:
+        marker = "COLLSCAN" if entry["collscan"] else "ok"
+        print(f"{marker:<9} {entry['collection']:<13} {entry['query']:<32} {' <- '.join(entry['stages'])}")
+    return 1 if any(entry["collscan"] for entry in report) else 0
+
+async def run_ensure_indexes() -> int:
+    missing = await ensure_indexes()
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            name = f"{collection_name}.{index.document['name']}"
+            print(f"{'MISSING' if name in missing else 'ok':<9} {name}")
+    return 1 if missing else 0
+
+async def run_rebuild_rollups(verify_only: bool) -> int:
+    mismatches = await rebuild_rollups(write=not verify_only)
+    for mismatch in mismatches:
+        print(f"MISMATCH  {mismatch}")
+    if verify_only:
+        print("Rollups match" if not mismatches else f"{len(mismatches)} rollup counters differ")
+        return 1 if mismatches else 0
+    print(f"Rebuilt analytics rollups ({len(mismatches)} counters corrected)")
+    return 0
+
+async def run_backfill_user_search() -> int:
+    print(f"Added search terms to {await backfill_user_search_terms()} users")
+    return 0
+
+async def run_backfill_account_owners() -> int:
+    print(f"Denormalized owners onto {await backfill_account_owners()} accounts")
+    return 0
+
+async def run_backfill_snapshots() -> int:
+    accounts = 0
+    snapshots = 0
+    async for account in db.accounts.find({}):
+        snapshots += await backfill_balance_snapshots(account)
+        accounts += 1
+    print(f"Backfilled {snapshots} daily balance snapshots for {accounts} accounts")
+    return 0
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Demo Banking API")
+    subcommands = parser.add_subparsers(dest="command")
+    serve = subcommands.add_parser("serve", help="run the API server (default)")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8001)
+    serve.add_argument("--workers", type=int, default=SERVER_WORKERS,
+                       help="worker processes; each opens its own Mongo pool of MONGO_MAX_POOL_SIZE and keeps "
+                            "its own metrics, slow query log, profiles and caches, which /api/metrics and the "
+                            "admin endpoints report for whichever worker serves the request")
+    parser.set_defaults(host="0.0.0.0", port=8001, workers=SERVER_WORKERS)
+    subcommands.add_parser("ensure-indexes", help="create and verify all declared indexes")
+    subcommands.add_parser("check-query-plans", help="report API query shapes that fall back to COLLSCAN")
+    subcommands.add_parser("backfill-snapshots", help="rebuild daily balance snapshots from transaction history")
+    subcommands.add_parser("backfill-user-search", help="add admin directory search terms to existing users")
+    subcommands.add_parser("backfill-account-owners", help="denormalize owner name/email onto existing accounts")
+    subcommands.add_parser("check-invalidation-bus", help="verify change-stream cache invalidation (needs a replica set)")
+    rebuild = subcommands.add_parser("rebuild-rollups", help="recompute analytics rollups and report drift")
+    rebuild.add_argument("--verify-only", action="store_true", help="only compare, exit non-zero on mismatch")
+    args = parser.parse_args()
+
+    if args.command not in (None, "serve"):
+        connect_database()
+    if args.command == "ensure-indexes":
+        sys.exit(asyncio.run(run_ensure_indexes()))
+    elif args.command == "check-query-plans":
+        sys.exit(asyncio.run(run_check_query_plans()))
+    elif args.command == "backfill-snapshots":
+        sys.exit(asyncio.run(run_backfill_snapshots()))
+    elif args.command == "backfill-user-search":
+        sys.exit(asyncio.run(run_backfill_user_search()))
+    elif args.command == "backfill-account-owners":
+        sys.exit(asyncio.run(run_backfill_account_owners()))
+    elif args.command == "rebuild-rollups":
+        sys.exit(asyncio.run(run_rebuild_rollups(args.verify_only)))
+    elif args.command == "check-invalidation-bus":
+        sys.exit(asyncio.run(run_check_invalidation_bus()))
+    else:
+        import uvicorn
+        if args.workers > 1:
+            # Worker processes import the app themselves, so uvicorn needs it by name
+            uvicorn.run("server:app", app_dir=os.path.dirname(os.path.abspath(__file__)),
+                        host=args.host, port=args.port, workers=args.workers)
+        else:
+            uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
@@ -0,0 +1,530 @@
+"""Concurrency benchmark for the Demo Banking API.
+
+Run it against a local server before and after a change and compare the
+requests/sec and latency percentiles reported at each concurrency level:
+
+    python backend_benchmark.py --base-url http://localhost:8001/api --output after.json
+    python backend_benchmark.py --scenario login --concurrency 1 16 64
+
+Moving from the blocking pymongo client to motor, measured with `accounts`
+(500 requests per level, one CPU) against mongomock with a simulated 5 ms
+round trip per command, took requests/sec at 1/16/128 clients from
+53.9/57.4/56.6 to 69.4/230.4/194.1, and p50 at 128 clients from 2227 ms
+to 484 ms. The blocking client serialises every request behind the one in
+Mongo, so its throughput stays flat as clients are added.
+
+The `accounts` scenario measures authenticated GET /accounts (auth + one
+query); `login` measures POST /auth/login, which is dominated by the
+password KDF and is used to tune PASSWORD_HASH_ROUNDS/PASSWORD_HASH_WORKERS.
+`transfers` registers a fresh customer and fires internal checking -> savings
+transfers at the one checking account, then verifies that the successful
+transfers add up exactly to the balance that left it (no overdraft, no lost
+update):
+
+    python backend_benchmark.py --scenario transfers --requests 200 --transfer-amount 10
+
+`batch-transfers` sends the same transfers through POST /transfers/batch,
+--batch-size items per request; compare its transfers_per_sec with the
+`transfers` scenario.
+
+`mix` drives a weighted blend of login, account list, history, statement,
+transfers and admin analytics from --customers registered customers and
+reports RPS and p50/p95/p99 per endpoint as well as overall. --serve starts
+the API locally (uvicorn, against --mongo-url) for the duration of the run,
+and --compare prints the change against a previous --output file:
+
+    python backend_benchmark.py --serve --scenario mix --concurrency 1 16 64 --output release-1.4.json
+    python backend_benchmark.py --serve --scenario mix --compare release-1.4.json --output release-1.5.json
+
+--replica-set-report reads each replica set member's opcounters before and
+after the run and reports where the reads went. Against a local three-member
+replica set, compare the primary's share of reads with reporting reads pinned
+to the primary and with them allowed on secondaries (--read-preference sets
+REPORTING_READ_PREFERENCE for the --serve server):
+
+    for port in 27017 27018 27019; do
+        mkdir -p /tmp/rs0-$port && mongod --replSet rs0 --port $port --dbpath /tmp/rs0-$port --fork --logpath /tmp/rs0-$port.log
+    done
+    mongosh --eval 'rs.initiate({_id: "rs0", members: [{_id: 0, host: "localhost:27017"},
+        {_id: 1, host: "localhost:27018"}, {_id: 2, host: "localhost:27019"}]})'
+    RS="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+    python backend_benchmark.py --serve --mongo-url "$RS" --scenario mix --replica-set-report \
+        --read-preference primary --output primary.json
+    python backend_benchmark.py --serve --mongo-url "$RS" --scenario mix --replica-set-report \
+        --read-preference secondaryPreferred --compare primary.json
+
+`serialization` needs no server: it times rendering a page of transactions
+the old way (stringify `_id` per document, jsonable_encoder, stdlib json)
+against the current one (`_id` projected away, orjson straight from the
+documents):
+
+    python backend_benchmark.py --scenario serialization --requests 500
+"""
+import asyncio
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pymongo import MongoClient
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def sample_transactions(count, with_object_id):
+    """Build `count` transaction documents shaped like the ones the API returns"""
+    now = datetime.utcnow()
+    transactions = []
+    for i in range(count):
+        transaction = {
+            "transaction_id": str(uuid.uuid4()),
+            "from_account_id": str(uuid.uuid4()),
+            "to_account_id": None,
+            "amount": 125.5 + i,
+            "transfer_type": "wire",
+            "description": f"Vendor payment {i}",
+            "recipient_name": "Acme Supplies",
+            "recipient_bank": "First Demo Bank",
+            "routing_number": "021000021",
+            "status": "pending",
+            "user_id": str(uuid.uuid4()),
+            "confirmation_number": uuid.uuid4().hex[:8].upper(),
+            "estimated_arrival": now,
+            "created_at": now,
+            "updated_at": now
+        }
+        if with_object_id:
+            transaction["_id"] = ObjectId()
+        transactions.append(transaction)
+    return transactions
+
+
+def serialization_benchmark(count=500, rounds=200):
+    """Time rendering {"transactions": [...]} for `count` documents, before and after"""
+    def before():
+        transactions = sample_transactions(count, with_object_id=True)
+        started = time.perf_counter()
+        for transaction in transactions:
+            if "_id" in transaction:
+                transaction["_id"] = str(transaction["_id"])
+        JSONResponse(jsonable_encoder({"transactions": transactions, "next_cursor": None}))
+        return time.perf_counter() - started
+
+    def after():
+        transactions = sample_transactions(count, with_object_id=False)
+        started = time.perf_counter()
+        ORJSONResponse({"transactions": transactions, "next_cursor": None})
+        return time.perf_counter() - started
+
+    print(f"🔍 Serializing {count} transactions, {rounds} rounds")
+    results = []
+    for name, render in [("before", before), ("after", after)]:
+        timings = [render() for _ in range(rounds)]
+        result = {
+            "scenario": "serialization",
+            "variant": name,
+            "documents": count,
+            "rounds": rounds,
+            "p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "p99_ms": round(percentile(timings, 99) * 1000, 3)
+        }
+        results.append(result)
+        print(f"  {name:<7} p50={result['p50_ms']}ms p99={result['p99_ms']}ms")
+    return {"timestamp": datetime.now().isoformat(), "results": results}
+
+
+# Relative weights of the `mix` scenario, roughly what the web frontend issues
+DEFAULT_MIX = {"login": 5, "accounts": 35, "history": 25, "statement": 10, "transfer": 20, "analytics": 5}
+
+
+def parse_mix(value):
+    """Parse "login=5,accounts=35,..." into a weights dict"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown mix entry {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def latency_stats(latencies, errors, elapsed):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+    }
+
+
+class BankingAPIBenchmark:
+    def __init__(self, base_url, requests_per_level=500, scenario="accounts", transfer_amount=10.0,
+                 batch_size=1, mix=None, customers=8, seed=0):
+        self.base_url = base_url.rstrip("/")
+        self.requests_per_level = requests_per_level
+        self.scenario = scenario
+        self.transfer_amount = transfer_amount
+        self.batch_size = batch_size if scenario == "batch-transfers" else 1
+        self.mix = mix or DEFAULT_MIX
+        self.customer_count = customers
+        self.random = random.Random(seed)
+        self.admin_email = "admin@demobank.com"
+        self.admin_password = "admin123"
+        self.admin_token = None
+        self.customer_token = None
+        self.accounts = {}
+        self.customers = []
+        self.results = []
+
+    async def login_admin(self, client):
+        """Log in once so every benchmarked request pays for auth + one query"""
+        response = await client.post(f"{self.base_url}/auth/login", json={
+            "email": self.admin_email,
+            "password": self.admin_password
+        })
+        response.raise_for_status()
+        self.admin_token = response.json()["token"]
+
+    async def register_customer(self, client):
+        """Register a throwaway customer whose checking/savings accounts receive the transfers"""
+        response = await client.post(f"{self.base_url}/auth/register", json={
+            "email": f"benchmark-{uuid.uuid4().hex[:12]}@demobank.com",
+            "password": "benchmark123",
+            "first_name": "Bench",
+            "last_name": "Mark",
+            "phone": "555-0100",
+            "address": "1 Benchmark Way",
+            "date_of_birth": "1990-01-01"
+        })
+        response.raise_for_status()
+        self.customer_token = response.json()["token"]
+        self.accounts = {account["account_type"]: account for account in response.json()["accounts"]}
+        return {
+            "email": response.json()["user"]["email"],
+            "token": self.customer_token,
+            "accounts": self.accounts
+        }
+
+    async def account_balance(self, client, account_type):
+        headers = {"Authorization": f"Bearer {self.customer_token}"}
+        response = await client.get(f"{self.base_url}/accounts", headers=headers)
+        response.raise_for_status()
+        return next(a["balance"] for a in response.json()["accounts"] if a["account_type"] == account_type)
+
+    def mixed_request(self, client):
+        """Pick one weighted `mix` operation for a random customer; returns (endpoint, coroutine)"""
+        operation = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        customer = self.random.choice(self.customers)
+        headers = {"Authorization": f"Bearer {customer['token']}"}
+        checking = customer["accounts"]["checking"]["account_id"]
+        if operation == "login":
+            return "POST /auth/login", client.post(f"{self.base_url}/auth/login", json={
+                "email": customer["email"],
+                "password": "benchmark123"
+            })
+        if operation == "accounts":
+            return "GET /accounts", client.get(f"{self.base_url}/accounts", headers=headers)
+        if operation == "history":
+            return "GET /accounts/{id}/transactions", client.get(
+                f"{self.base_url}/accounts/{checking}/transactions", headers=headers, params={"limit": 20}
+            )
+        if operation == "statement":
+            return "GET /accounts/{id}/statement", client.get(
+                f"{self.base_url}/accounts/{checking}/statement", headers=headers
+            )
+        if operation == "transfer":
+            return "POST /transfers", client.post(f"{self.base_url}/transfers", headers=headers, json={
+                "from_account_id": checking,
+                "to_account_id": customer["accounts"]["savings"]["account_id"],
+                "amount": 0.01,
+                "transfer_type": "internal",
+                "description": "Benchmark transfer"
+            })
+        return "GET /admin/analytics", client.get(
+            f"{self.base_url}/admin/analytics", headers={"Authorization": f"Bearer {self.admin_token}"}
+        )
+
+    def request(self, client):
+        """Return (endpoint, coroutine) issuing one request of the selected scenario"""
+        if self.scenario == "mix":
+            return self.mixed_request(client)
+        if self.scenario == "login":
+            return "POST /auth/login", client.post(f"{self.base_url}/auth/login", json={
+                "email": self.admin_email,
+                "password": self.admin_password
+            })
+        if self.scenario in ("transfers", "batch-transfers"):
+            headers = {"Authorization": f"Bearer {self.customer_token}"}
+            transfer = {
+                "from_account_id": self.accounts["checking"]["account_id"],
+                "to_account_id": self.accounts["savings"]["account_id"],
+                "amount": self.transfer_amount,
+                "transfer_type": "internal",
+                "description": "Benchmark transfer"
+            }
+            if self.scenario == "batch-transfers":
+                return "POST /transfers/batch", client.post(f"{self.base_url}/transfers/batch", headers=headers,
+                                                            json={"transfers": [transfer] * self.batch_size})
+            return "POST /transfers", client.post(f"{self.base_url}/transfers", headers=headers, json=transfer)
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        return "GET /accounts", client.get(f"{self.base_url}/accounts", headers=headers)
+
+    async def run_level(self, client, concurrency):
+        """Issue requests_per_level requests from `concurrency` workers"""
+        remaining = self.requests_per_level
+        errors = 0
+        latencies = []
+        by_endpoint = {}
+        if self.scenario in ("transfers", "batch-transfers"):
+            await self.register_customer(client)
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                endpoint, request = self.request(client)
+                started = time.perf_counter()
+                response = await request
+                latency = time.perf_counter() - started
+                latencies.append(latency)
+                stats = by_endpoint.setdefault(endpoint, {"latencies": [], "errors": 0})
+                stats["latencies"].append(latency)
+                if response.status_code != 200:
+                    errors += 1
+                    stats["errors"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        result = {
+            "scenario": self.scenario,
+            "concurrency": concurrency,
+            "seconds": round(elapsed, 3),
+            **latency_stats(latencies, errors, elapsed),
+            "transfers_per_sec": round(self.requests_per_level * self.batch_size / elapsed, 1),
+            "endpoints": {
+                endpoint: latency_stats(stats["latencies"], stats["errors"], elapsed)
+                for endpoint, stats in sorted(by_endpoint.items())
+            }
+        }
+        if self.scenario in ("transfers", "batch-transfers"):
+            # Rejected transfers (insufficient funds) count as errors; every accepted one must be debited
+            opening = self.accounts["checking"]["balance"]
+            closing = await self.account_balance(client, "checking")
+            accepted = (self.requests_per_level - errors) * self.batch_size
+            result["consistent"] = closing >= 0 and abs((opening - closing) - accepted * self.transfer_amount) < 0.005
+        self.results.append(result)
+        print(f"  concurrency={concurrency:<4} {result['requests_per_sec']:>8} req/s  "
+              f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms  ({errors} errors)"
+              + ("" if "consistent" not in result else f"  consistent={result['consistent']}"))
+        if len(result["endpoints"]) > 1:
+            for endpoint, stats in result["endpoints"].items():
+                print(f"    {endpoint:<34} {stats['requests_per_sec']:>8} req/s  p50={stats['p50_ms']}ms "
+                      f"p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms  ({stats['errors']} errors)")
+        return result
+
+    async def run(self, levels):
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+            await self.login_admin(client)
+            if self.scenario == "mix":
+                self.customers = [await self.register_customer(client) for _ in range(self.customer_count)]
+            print(f"🔍 Benchmarking scenario '{self.scenario}' against {self.base_url}")
+            for concurrency in levels:
+                await self.run_level(client, concurrency)
+        return {
+            "base_url": self.base_url,
+            "timestamp": datetime.now().isoformat(),
+            "revision": git_revision(),
+            "config": {
+                "scenario": self.scenario,
+                "requests_per_level": self.requests_per_level,
+                "concurrency": levels,
+                "mix": self.mix if self.scenario == "mix" else None,
+                "customers": self.customer_count if self.scenario == "mix" else None
+            },
+            "results": self.results
+        }
+
+
+def member_opcounters(mongo_url):
+    """Opcounters of every replica set member, read directly from each one"""
+    with MongoClient(mongo_url, serverSelectionTimeoutMS=5000) as client:
+        hello = client.admin.command("hello")
+    counters = {}
+    for host in hello.get("hosts", []):
+        with MongoClient(host, directConnection=True, serverSelectionTimeoutMS=5000) as member:
+            status = member.admin.command("serverStatus")
+        counters[host] = {
+            "role": "primary" if host == hello.get("primary") else "secondary",
+            **{name: status["opcounters"][name] for name in ("query", "getmore", "command", "update", "insert")}
+        }
+    if not counters:
+        raise RuntimeError(f"{mongo_url} is not a replica set; --replica-set-report needs one")
+    return counters
+
+
+def replica_set_report(before, after):
+    """Per-member opcounter deltas plus each member's share of the reads (query + getmore)"""
+    report = {
+        host: {"role": counters["role"],
+               **{name: counters[name] - before.get(host, {}).get(name, 0) for name in counters if name != "role"}}
+        for host, counters in after.items()
+    }
+    reads = sum(member["query"] + member["getmore"] for member in report.values())
+    for member in report.values():
+        member["read_share"] = round((member["query"] + member["getmore"]) / reads, 3) if reads else None
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LocalServer:
+    """Run backend/server.py under uvicorn on a free port for the duration of a benchmark"""
+
+    def __init__(self, mongo_url, workers=1, read_preference=None):
+        self.mongo_url = mongo_url
+        self.workers = workers
+        self.read_preference = read_preference
+        self.process = None
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}/api"
+
+    def __enter__(self):
+        backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--app-dir", backend_dir,
+             "--host", "127.0.0.1", "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            env={**os.environ, "MONGO_URL": self.mongo_url,
+                 **({"REPORTING_READ_PREFERENCE": self.read_preference} if self.read_preference else {})}
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with status {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.base_url}/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"server did not become healthy within 30s; is MongoDB reachable at {self.mongo_url}?")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def compare_reports(baseline, report):
+    """Print per-level, per-endpoint changes in RPS and p50/p99 against a baseline report"""
+    def index(results):
+        return {
+            (result["concurrency"], endpoint): stats
+            for result in results
+            for endpoint, stats in result.get("endpoints", {}).items()
+        }
+
+    before = index(baseline["results"])
+    print(f"Compared with {baseline.get('revision') or baseline['timestamp']}:")
+    for key, stats in index(report["results"]).items():
+        if key not in before:
+            continue
+        old = before[key]
+        deltas = [
+            f"{name} {old[name]} -> {stats[name]} ({(stats[name] - old[name]) / old[name] * 100:+.1f}%)"
+            for name in ("requests_per_sec", "p50_ms", "p99_ms") if old.get(name)
+        ]
+        print(f"  concurrency={key[0]:<4} {key[1]:<34} " + "  ".join(deltas))
+    if baseline.get("replica_set") and report.get("replica_set"):
+        share = lambda members: next((m["read_share"] for m in members.values() if m["role"] == "primary"), None)
+        print(f"  primary read share {share(baseline['replica_set'])} -> {share(report['replica_set'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency benchmark for the Demo Banking API")
+    parser.add_argument("--base-url", default="http://localhost:8001/api")
+    parser.add_argument("--scenario", choices=["accounts", "login", "transfers", "batch-transfers", "mix", "serialization"], default="accounts")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="requests per concurrency level (documents per response for serialization)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--transfer-amount", type=float, default=10.0, help="amount per transfer (transfers scenario)")
+    parser.add_argument("--batch-size", type=int, default=100, help="transfers per request (batch-transfers scenario)")
+    parser.add_argument("--mix", type=parse_mix, help="weights for the mix scenario, e.g. login=5,accounts=35,transfer=20")
+    parser.add_argument("--customers", type=int, default=8, help="customers registered for the mix scenario")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the mix scenario")
+    parser.add_argument("--serve", action="store_true", help="start the API locally for the run instead of using --base-url")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+                        help="MongoDB the --serve server connects to")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --serve")
+    parser.add_argument("--read-preference", help="REPORTING_READ_PREFERENCE for --serve, e.g. primary or secondaryPreferred")
+    parser.add_argument("--replica-set-report", action="store_true",
+                        help="report per-member opcounter deltas for the run from the replica set at --mongo-url")
+    parser.add_argument("--compare", help="baseline JSON report to compare the results against")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    def run_benchmark(base_url):
+        benchmark = BankingAPIBenchmark(base_url, args.requests, args.scenario, args.transfer_amount,
+                                        args.batch_size, args.mix, args.customers, args.seed)
+        return asyncio.run(benchmark.run(args.concurrency))
+
+    if args.replica_set_report and args.scenario != "serialization":
+        opcounters = member_opcounters(args.mongo_url)
+
+    if args.scenario == "serialization":
+        report = serialization_benchmark(args.requests)
+    elif args.serve:
+        with LocalServer(args.mongo_url, args.workers, args.read_preference) as server:
+            report = run_benchmark(server.base_url)
+    else:
+        report = run_benchmark(args.base_url)
+
+    if args.replica_set_report and args.scenario != "serialization":
+        report["replica_set"] = replica_set_report(opcounters, member_opcounters(args.mongo_url))
+        for host, member in report["replica_set"].items():
+            print(f"  {host:<22} {member['role']:<9} query={member['query']} getmore={member['getmore']} "
+                  f"command={member['command']} update={member['update']}  read share={member['read_share']}")
+
+    if args.compare and args.scenario != "serialization":
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,18 @@ import './App.css';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
+// Columns the transaction lists render; requested via ?fields= to keep payloads small
+const TRANSACTION_FIELDS = 'transaction_id,from_account_id,to_account_id,amount,transfer_type,description,status,recipient_name,confirmation_number,created_at';
+const USER_FIELDS = 'user_id,first_name,last_name,email,role,status';
+const ACCOUNT_FIELDS = 'account_id,user_name,user_email,account_type,balance,status';
+
 function App() {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem('token'));
   const [currentView, setCurrentView] = useState('dashboard');
   const [accounts, setAccounts] = useState([]);
   const [transactions, setTransactions] = useState([]);
+  const [transactionsCursor, setTransactionsCursor] = useState(null);
   const [selectedAccount, setSelectedAccount] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
@@ -49,8 +55,13 @@ function App() {
   });
 
   const [allUsers, setAllUsers] = useState([]);
+  const [allUsersTotal, setAllUsersTotal] = useState(null);
+  const [userSearch, setUserSearch] = useState('');
   const [allAccounts, setAllAccounts] = useState([]);
+  const [allAccountsTotal, setAllAccountsTotal] = useState(null);
+  const [accountOwnerFilter, setAccountOwnerFilter] = useState('');
   const [allTransactions, setAllTransactions] = useState([]);
+  const [allTransactionsCursor, setAllTransactionsCursor] = useState(null);
   const [adminAnalytics, setAdminAnalytics] = useState(null);
 
   // Transaction filters
@@ -202,7 +213,7 @@ function App() {
     }
   };
 
-  const fetchTransactions = async (accountId) => {
+  const fetchTransactions = async (accountId, cursor = null) => {
     try {
       setLoading(true);
       setSelectedAccount(accountId);
@@ -212,9 +223,12 @@ function App() {
       if (transactionFilters.end_date) queryParams.append('end_date', transactionFilters.end_date);
       if (transactionFilters.transaction_type) queryParams.append('transaction_type', transactionFilters.transaction_type);
       queryParams.append('limit', transactionFilters.limit);
+      if (cursor) queryParams.append('cursor', cursor);
+      queryParams.append('fields', TRANSACTION_FIELDS);
       
       const data = await apiCall(`/accounts/${accountId}/transactions?${queryParams}`);
-      setTransactions(data.transactions);
+      setTransactions(cursor ? (prev) => [...prev, ...data.transactions] : data.transactions);
+      setTransactionsCursor(data.next_cursor);
       setCurrentView('transactions');
     } catch (err) {
       setError(err.message);
@@ -246,15 +260,18 @@ function App() {
     try {
       setLoading(true);
       const [usersData, accountsData, transactionsData, analyticsData] = await Promise.all([
-        apiCall('/admin/users'),
-        apiCall('/admin/accounts'),
-        apiCall('/admin/transactions'),
+        apiCall(`/admin/users?limit=10&fields=${USER_FIELDS}&q=${encodeURIComponent(userSearch)}`),
+        apiCall(adminAccountsPath()),
+        apiCall(`/admin/transactions?limit=15&fields=${TRANSACTION_FIELDS}`),
         apiCall('/admin/analytics')
       ]);
       
       setAllUsers(usersData.users);
+      setAllUsersTotal(usersData.total);
       setAllAccounts(accountsData.accounts);
+      setAllAccountsTotal(accountsData.total);
       setAllTransactions(transactionsData.transactions);
+      setAllTransactionsCursor(transactionsData.next_cursor);
       setAdminAnalytics(analyticsData.analytics);
     } catch (err) {
       setError(err.message);
@@ -263,6 +280,19 @@ function App() {
     }
   };
 
+  const fetchMoreAdminTransactions = async () => {
+    try {
+      setLoading(true);
+      const data = await apiCall(`/admin/transactions?limit=15&fields=${TRANSACTION_FIELDS}&cursor=${encodeURIComponent(allTransactionsCursor)}`);
+      setAllTransactions((prev) => [...prev, ...data.transactions]);
+      setAllTransactionsCursor(data.next_cursor);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleAdminCreditDebit = async (e) => {
     e.preventDefault();
     try {
@@ -294,6 +324,40 @@ function App() {
     }
   };
 
+  const adminAccountsPath = () => {
+    const params = new URLSearchParams({ limit: 100, fields: ACCOUNT_FIELDS });
+    if (accountOwnerFilter) params.append('owner_email', accountOwnerFilter);
+    return `/admin/accounts?${params}`;
+  };
+
+  const filterAccounts = async (e) => {
+    e.preventDefault();
+    try {
+      setLoading(true);
+      const data = await apiCall(adminAccountsPath());
+      setAllAccounts(data.accounts);
+      setAllAccountsTotal(data.total);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const searchUsers = async (e) => {
+    e.preventDefault();
+    try {
+      setLoading(true);
+      const data = await apiCall(`/admin/users?limit=10&fields=${USER_FIELDS}&q=${encodeURIComponent(userSearch)}`);
+      setAllUsers(data.users);
+      setAllUsersTotal(data.total);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleUserStatusUpdate = async (userId, newStatus) => {
     try {
       setLoading(true);
@@ -319,7 +383,17 @@ function App() {
       const response = await apiCall('/admin/bulk-operations', {
         method: 'POST'
       });
-      setSuccess(`Bulk operations completed: ${response.interest_applied} interest applied, ${response.fees_applied} fees applied`);
+
+      // Month-end processing runs as a background job; poll it until it finishes
+      let job = response.job;
+      while (job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        job = (await apiCall(`/admin/jobs/${job.job_id}`)).job;
+      }
+      if (job.status !== 'completed') {
+        throw new Error(`Bulk operations failed: ${job.error}`);
+      }
+      setSuccess(`Bulk operations completed: ${job.counts.interest_applied} interest applied, ${job.counts.fees_applied} fees applied`);
       fetchAdminData();
     } catch (err) {
       setError(err.message);
@@ -957,6 +1031,17 @@ function App() {
               <p className="text-gray-500">No transactions found</p>
             </div>
           )}
+
+          {transactionsCursor && (
+            <div className="text-center py-4">
+              <button
+                onClick={() => fetchTransactions(selectedAccount, transactionsCursor)}
+                className="bg-blue-600 text-white px-4 py-2 rounded-lg hover:bg-blue-700 transition"
+              >
+                Load More
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -1105,7 +1190,21 @@ function App() {
       <div className="grid lg:grid-cols-2 gap-8">
         {/* Users Table */}
         <div className="bg-white rounded-xl shadow-lg p-6">
-          <h3 className="text-lg font-semibold text-gray-800 mb-4">Users Management</h3>
+          <h3 className="text-lg font-semibold text-gray-800 mb-4">
+            Users Management{allUsersTotal !== null && ` (${allUsersTotal})`}
+          </h3>
+          <form onSubmit={searchUsers} className="flex gap-2 mb-4">
+            <input
+              type="text"
+              value={userSearch}
+              onChange={(e) => setUserSearch(e.target.value)}
+              placeholder="Search by email, name or phone"
+              className="flex-1 px-3 py-2 border border-gray-300 rounded-lg text-sm"
+            />
+            <button type="submit" className="bg-blue-600 text-white px-4 py-2 rounded-lg text-sm hover:bg-blue-700">
+              Search
+            </button>
+          </form>
           <div className="overflow-x-auto">
             <table className="w-full text-sm">
               <thead className="bg-gray-50">
@@ -1118,7 +1217,7 @@ function App() {
                 </tr>
               </thead>
               <tbody className="divide-y divide-gray-200">
-                {allUsers.slice(0, 10).map((user) => (
+                {allUsers.map((user) => (
                   <tr key={user.user_id}>
                     <td className="px-4 py-2">{user.first_name} {user.last_name}</td>
                     <td className="px-4 py-2">{user.email}</td>
@@ -1150,7 +1249,21 @@ function App() {
 
         {/* Accounts Table */}
         <div className="bg-white rounded-xl shadow-lg p-6">
-          <h3 className="text-lg font-semibold text-gray-800 mb-4">Accounts Overview</h3>
+          <h3 className="text-lg font-semibold text-gray-800 mb-4">
+            Accounts Overview{allAccountsTotal !== null && ` (${allAccountsTotal})`}
+          </h3>
+          <form onSubmit={filterAccounts} className="flex gap-2 mb-4">
+            <input
+              type="email"
+              value={accountOwnerFilter}
+              onChange={(e) => setAccountOwnerFilter(e.target.value)}
+              placeholder="Filter by owner email"
+              className="flex-1 px-3 py-2 border border-gray-300 rounded-lg text-sm"
+            />
+            <button type="submit" className="bg-blue-600 text-white px-4 py-2 rounded-lg text-sm hover:bg-blue-700">
+              Filter
+            </button>
+          </form>
           <div className="overflow-x-auto">
             <table className="w-full text-sm">
               <thead className="bg-gray-50">
@@ -1198,7 +1311,7 @@ function App() {
               </tr>
             </thead>
             <tbody className="divide-y divide-gray-200">
-              {allTransactions.slice(0, 15).map((transaction) => (
+              {allTransactions.map((transaction) => (
                 <tr key={transaction.transaction_id}>
                   <td className="px-4 py-2">{formatDate(transaction.created_at)}</td>
                   <td className="px-4 py-2 capitalize">{transaction.transfer_type?.replace('_', ' ')}</td>
@@ -1219,6 +1332,17 @@ function App() {
             </tbody>
           </table>
         </div>
+
+        {allTransactionsCursor && (
+          <div className="text-center pt-4">
+            <button
+              onClick={fetchMoreAdminTransactions}
+              className="bg-blue-600 text-white px-4 py-2 rounded-lg hover:bg-blue-700 transition"
+            >
+              Load More
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server
+
+
+def row(amount, transaction_type="credit"):
+    return {"account_id": "acc", "amount": amount, "type": transaction_type, "description": "x", "backdate": ""}
+
+
+class ParseCreditDebitRowTest(unittest.TestCase):
+    def test_valid_row(self):
+        data = server.parse_credit_debit_row(row(" 12.50 ", "Debit"))
+        self.assertEqual(data.account_id, "acc")
+        self.assertEqual(data.amount, 12.5)
+        self.assertEqual(data.transaction_type, "debit")
+        self.assertIsNone(data.backdate)
+
+    def test_rejects_non_finite_amounts(self):
+        for amount in ["inf", "-inf", "Infinity", "nan", "1e400"]:
+            with self.subTest(amount=amount):
+                with self.assertRaisesRegex(ValueError, "positive number"):
+                    server.parse_credit_debit_row(row(amount))
+
+    def test_rejects_zero_and_negative_amounts(self):
+        for amount in ["0", "-5"]:
+            with self.subTest(amount=amount):
+                with self.assertRaises(ValueError):
+                    server.parse_credit_debit_row(row(amount))
+
+    def test_rejects_amounts_over_the_cap(self):
+        with self.assertRaisesRegex(ValueError, "must not exceed"):
+            server.parse_credit_debit_row(row(str(server.CREDIT_DEBIT_MAX_AMOUNT * 2)))
+        self.assertEqual(server.parse_credit_debit_row(row(str(server.CREDIT_DEBIT_MAX_AMOUNT))).amount,
+                         server.CREDIT_DEBIT_MAX_AMOUNT)
+
+    def test_rejects_malformed_rows(self):
+        with self.assertRaisesRegex(ValueError, "must be a number"):
+            server.parse_credit_debit_row(row("ten"))
+        with self.assertRaisesRegex(ValueError, "credit or debit"):
+            server.parse_credit_debit_row(row("10", "refund"))
+        with self.assertRaisesRegex(ValueError, "Missing account_id"):
+            server.parse_credit_debit_row({**row("10"), "account_id": " "})
+        with self.assertRaisesRegex(ValueError, "Wrong number of columns"):
+            server.parse_credit_debit_row({**row("10"), None: ["extra"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server
+from mongomock_motor import AsyncMongoMockClient
+
+
+def account(account_id, created_at=datetime(2026, 1, 15), **fields):
+    return {
+        "account_id": account_id,
+        "user_id": "user",
+        "account_type": "checking",
+        "status": "active",
+        "balance": 1000.0,
+        "balance_version": 0,
+        "interest_rate": 0.0,
+        "monthly_fee": 5.0,
+        "created_at": created_at,
+        **fields
+    }
+
+
+class MonthEndChunkTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.saved = server.client, server.db
+        server.client = AsyncMongoMockClient()
+        server.db = server.client.demo_banking
+        # Re-posts rely on the unique transaction_id index to keep ledger rows single
+        await server.ensure_indexes()
+
+    async def asyncTearDown(self):
+        server.client, server.db = self.saved
+
+    async def post(self, period, account_id="acc"):
+        accounts = await server.db.accounts.find(
+            {"account_id": account_id}, server.MONTH_END_PROJECTION
+        ).to_list(length=None)
+        return await server.apply_month_end_chunk(accounts, period)
+
+    async def balance(self, account_id="acc"):
+        return (await server.db.accounts.find_one({"account_id": account_id}))["balance"]
+
+    async def test_each_period_is_posted_once(self):
+        await server.db.accounts.insert_one(account("acc"))
+        self.assertEqual(await self.post("2026-10"), {"postings": 1, "interest_applied": 0, "fees_applied": 1})
+        self.assertEqual(await self.post("2026-09"), {"postings": 1, "interest_applied": 0, "fees_applied": 1})
+        # Posting the latest period again must not charge a second fee
+        self.assertEqual(await self.post("2026-10"), {"postings": 0, "interest_applied": 0, "fees_applied": 0})
+        self.assertEqual(await self.balance(), 990.0)
+        self.assertEqual(await server.db.transactions.count_documents({"from_account_id": "acc"}), 2)
+
+    async def test_legacy_posting_is_not_repeated(self):
+        await server.db.accounts.insert_one(account("acc", month_end_period="2026-10", month_end_amount=-5.0))
+        self.assertEqual((await self.post("2026-10"))["postings"], 0)
+        self.assertEqual(await self.balance(), 1000.0)
+
+    async def test_accounts_opened_after_the_period_are_skipped(self):
+        await server.db.accounts.insert_one(account("acc", created_at=datetime(2026, 10, 1)))
+        self.assertEqual((await self.post("2026-09"))["postings"], 0)
+        self.assertEqual(await self.balance(), 1000.0)
+
+    async def test_interest_is_counted_separately(self):
+        await server.db.accounts.insert_one(account("acc", account_type="savings", interest_rate=0.12, monthly_fee=0))
+        self.assertEqual(await self.post("2026-10"), {"postings": 1, "interest_applied": 1, "fees_applied": 0})
+        self.assertEqual(await self.balance(), 1010.0)
+
+
+class MonthEndPeriodTest(unittest.TestCase):
+    def test_only_the_current_period_can_be_posted(self):
+        current = datetime.utcnow()
+        self.assertIsNone(server.month_end_period_error(current.strftime("%Y-%m")))
+        for period in [f"{current.year + 1}-01", f"{current.year - 1}-12", f"{current.year}-13"]:
+            with self.subTest(period=period):
+                self.assertIn("Only the current period", server.month_end_period_error(period))
+
+
+if __name__ == "__main__":
+    unittest.main()
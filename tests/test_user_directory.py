@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server
+
+
+USERS = [
+    {"email": "bob2@x.com", "first_name": "Bob", "last_name": "Two", "phone": "(212) 555-0100"},
+    {"email": "alice@x.com", "first_name": "Alice", "last_name": "Smith", "phone": "2125550101"},
+    {"email": "carol@x.com", "first_name": "Carol", "last_name": "Jones", "phone": "+1 415 555 0102"},
+]
+
+
+def search(q):
+    """Emails of USERS whose search_terms match the directory filter for `q`"""
+    patterns = server.user_directory_filter(q, None, None)["search_terms"]["$in"]
+    return sorted(
+        user["email"] for user in USERS
+        if any(pattern.match(term) for pattern in patterns for term in server.user_search_terms(user))
+    )
+
+
+class UserDirectoryFilterTest(unittest.TestCase):
+    def test_text_query_does_not_search_its_digits(self):
+        self.assertEqual(search("bob2@x.com"), ["bob2@x.com"])
+        self.assertEqual(search("Bob2"), ["bob2@x.com"])
+
+    def test_phone_query_matches_digits_only_form(self):
+        self.assertEqual(search("(212) 555"), ["alice@x.com", "bob2@x.com"])
+        self.assertEqual(search("212-555-0101"), ["alice@x.com"])
+        self.assertEqual(search("+1 415"), ["carol@x.com"])
+
+    def test_name_prefix(self):
+        self.assertEqual(search("car"), ["carol@x.com"])
+        self.assertEqual(search("alice smi"), ["alice@x.com"])
+
+    def test_filters_without_query(self):
+        self.assertEqual(server.user_directory_filter("  ", "active", "customer"),
+                         {"status": "active", "role": "customer"})
+
+
+if __name__ == "__main__":
+    unittest.main()